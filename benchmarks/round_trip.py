@@ -0,0 +1,297 @@
+"""
+Round-trip latency and throughput of MCP requests against the example servers,
+run in-process over memory streams and over stdio. Needs no network or LLM.
+
+    python benchmarks/round_trip.py --output results.json
+    python benchmarks/round_trip.py --baseline results.json
+
+Each case is timed one request at a time for p50/p99 latency and requests/s,
+then again with --concurrency requests in flight for concurrent requests/s.
+With --baseline, the run fails if any case's p50 is more than --tolerance
+slower than in the baseline results.
+"""
+
+import argparse
+import asyncio
+import importlib.metadata
+import importlib.util
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.memory import create_connected_server_and_client_session
+from pydantic import AnyUrl
+
+REPO_DIR = Path(__file__).parent.parent.resolve()
+
+# Server script and the name of its Server or FastMCP instance
+SERVERS = {
+    "low_level": (REPO_DIR / "ch5/02_low_level_list_call_tools/server.py", "server"),
+    "low_level_structured": (
+        REPO_DIR / "ch5/03_low_level_structured_output/server.py",
+        "server",
+    ),
+    "resource_template": (REPO_DIR / "ch5/13_resource_template/server.py", "mcp"),
+    "pagination": (REPO_DIR / "ch6/11_low_level_pagination/server.py", "server"),
+    "calculator": (REPO_DIR / "ch3/calculator_server.py", "mcp"),
+}
+TRANSPORTS = ("in_process", "stdio")
+
+
+async def list_all_resources(session: ClientSession) -> list:
+    """Page through every resource, following nextCursor."""
+    resources = []
+    cursor = None
+    while True:
+        result = await session.list_resources(cursor=cursor)
+        resources.extend(result.resources)
+        cursor = result.nextCursor
+        if cursor is None:
+            return resources
+
+
+async def call_tool(session: ClientSession, name: str, arguments: dict) -> Any:
+    result = await session.call_tool(name, arguments)
+    if result.isError:
+        raise RuntimeError(f"Tool {name} failed: {result.content}")
+    return result
+
+
+# Case name, server, and the request to time
+CASES: list[tuple[str, str, Callable[[ClientSession], Awaitable[Any]]]] = [
+    ("list_tools", "low_level", lambda session: session.list_tools()),
+    ("list_tools", "calculator", lambda session: session.list_tools()),
+    (
+        "call_tool_scalar",
+        "low_level",
+        lambda session: call_tool(session, "add", {"a": 1, "b": 2}),
+    ),
+    (
+        "call_tool_scalar",
+        "calculator",
+        lambda session: call_tool(session, "add", {"a": 1, "b": 2}),
+    ),
+    (
+        "call_tool_structured",
+        "low_level_structured",
+        lambda session: call_tool(session, "add", {"a": 1, "b": 2}),
+    ),
+    (
+        "read_resource_text",
+        "resource_template",
+        lambda session: session.read_resource(AnyUrl("file:///1.txt")),
+    ),
+    (
+        "read_resource_blob",
+        "resource_template",
+        lambda session: session.read_resource(AnyUrl("file:///2.png")),
+    ),
+    ("list_resources_paginated", "pagination", list_all_resources),
+]
+
+
+def load_server(name: str) -> Any:
+    # The server directories are not packages, so load the server by path
+    path, attribute = SERVERS[name]
+    spec = importlib.util.spec_from_file_location(f"benchmark_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, attribute)
+
+
+@asynccontextmanager
+async def connect(server: str, transport: str) -> AsyncIterator[ClientSession]:
+    if transport == "in_process":
+        async with create_connected_server_and_client_session(
+            load_server(server)
+        ) as session:
+            yield session
+        return
+
+    path, _ = SERVERS[server]
+    server_parameters = StdioServerParameters(
+        command=sys.executable, args=[str(path)], cwd=str(path.parent)
+    )
+    # The servers' request logging goes to stderr, so discard it. The process
+    # is started by anyio, which takes a file descriptor as well as a file.
+    async with (
+        stdio_client(server_parameters, errlog=subprocess.DEVNULL) as (read, write),
+        ClientSession(read, write) as session,
+    ):
+        await session.initialize()
+        yield session
+
+
+async def measure(
+    session: ClientSession,
+    operation: Callable[[ClientSession], Awaitable[Any]],
+    iterations: int,
+    concurrency: int,
+    warmup: int,
+) -> dict[str, float]:
+    for _ in range(warmup):
+        await operation(session)
+
+    latencies = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        await operation(session)
+        latencies.append(time.perf_counter() - started_at)
+
+    remaining = iterations
+
+    async def send_requests() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await operation(session)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(send_requests() for _ in range(concurrency)))
+    concurrent_time = time.perf_counter() - started_at
+
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": statistics.quantiles(latencies, n=100)[98] * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "requests_per_s": iterations / sum(latencies),
+        "concurrent_requests_per_s": iterations / concurrent_time,
+    }
+
+
+async def run(
+    cases: list[tuple[str, str, Callable]],
+    transports: list[str],
+    iterations: int,
+    concurrency: int,
+    warmup: int,
+) -> list[dict]:
+    results = []
+    servers = list(dict.fromkeys(server for _, server, _ in cases))
+    for transport in transports:
+        for server in servers:
+            # One session per server, shared by all of its cases
+            async with connect(server, transport) as session:
+                for case, case_server, operation in cases:
+                    if case_server != server:
+                        continue
+                    print(f"{transport:10} {server:20} {case}", file=sys.stderr)
+                    metrics = await measure(
+                        session, operation, iterations, concurrency, warmup
+                    )
+                    results.append(
+                        {
+                            "case": case,
+                            "server": server,
+                            "transport": transport,
+                            **metrics,
+                        }
+                    )
+    return results
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    """Cases whose p50 is more than tolerance slower than in the baseline."""
+    baseline_results = {
+        (result["case"], result["server"], result["transport"]): result
+        for result in baseline["results"]
+    }
+    regressions = []
+    for result in results:
+        key = (result["case"], result["server"], result["transport"])
+        if key not in baseline_results:
+            continue
+        ratio = result["p50_ms"] / baseline_results[key]["p50_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{' '.join(key)}: p50 {result['p50_ms']:.3f}ms is "
+                f"{ratio:.2f}x the baseline"
+            )
+    return regressions
+
+
+def print_table(results: list[dict]) -> None:
+    print(
+        f"{'case':26}{'server':22}{'transport':12}{'p50_ms':>10}{'p99_ms':>10}"
+        f"{'req/s':>10}{'conc req/s':>12}"
+    )
+    for result in results:
+        print(
+            f"{result['case']:26}{result['server']:22}{result['transport']:12}"
+            f"{result['p50_ms']:10.3f}{result['p99_ms']:10.3f}"
+            f"{result['requests_per_s']:10.0f}"
+            f"{result['concurrent_requests_per_s']:12.0f}"
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument(
+        "--transport", choices=TRANSPORTS, action="append", dest="transports"
+    )
+    parser.add_argument(
+        "--case", action="append", dest="cases", help="Only run the named cases"
+    )
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    parser.add_argument(
+        "--baseline", type=Path, help="Results to check for regressions against"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    cases = [case for case in CASES if not args.cases or case[0] in args.cases]
+    # FastMCP servers set up INFO logging for every request when created,
+    # unless logging is already configured. In-process that would be timed
+    # along with the requests.
+    logging.basicConfig(level=logging.WARNING)
+    results = await run(
+        cases,
+        args.transports or list(TRANSPORTS),
+        args.iterations,
+        args.concurrency,
+        args.warmup,
+    )
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "mcp": importlib.metadata.version("mcp"),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "results": results,
+    }
+    print_table(results)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
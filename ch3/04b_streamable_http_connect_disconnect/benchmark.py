@@ -0,0 +1,151 @@
+"""
+Compare the streamable HTTP MCPClient with the stdio MCPClient from
+13_use_prompt against the calculator server, on this machine only.
+
+    python benchmark.py --calls 200 --batch 20
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from client import MCPClient as HTTPMCPClient
+from http_pool import HTTPTransportPool
+
+CH3_DIR = Path(__file__).parent.parent.resolve()
+SERVER_SCRIPT = CH3_DIR / "calculator_server.py"
+
+
+def load_stdio_client_class() -> type:
+    # The chapter directories are not packages, so load the stdio client by path
+    spec = importlib.util.spec_from_file_location(
+        "stdio_client", CH3_DIR / "13_use_prompt" / "client.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.MCPClient
+
+
+def start_http_server(port: int) -> subprocess.Popen:
+    serve = (
+        "import calculator_server as server; "
+        f"server.mcp.settings.port = {port}; "
+        "server.mcp.settings.log_level = 'WARNING'; "
+        "server.mcp.run(transport='streamable-http')"
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-c", serve],
+        cwd=CH3_DIR,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        with socket.socket() as probe:
+            if probe.connect_ex(("127.0.0.1", port)) == 0:
+                return server
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("HTTP calculator server did not start")
+
+
+async def measure(client, calls: int, batch: int) -> dict[str, float]:
+    # For stdio this includes spawning the server; the HTTP server is already up
+    started_at = time.perf_counter()
+    await client.connect()
+    connect_time = time.perf_counter() - started_at
+    try:
+        # Warm up so the first-call costs are not counted
+        await client.use_tool("add", {"a": 1, "b": 1})
+
+        latencies = []
+        for i in range(calls):
+            started_at = time.perf_counter()
+            await client.use_tool("add", {"a": i, "b": 1})
+            latencies.append(time.perf_counter() - started_at)
+
+        tool_calls = [("add", {"a": i, "b": 1}) for i in range(calls)]
+        started_at = time.perf_counter()
+        for start in range(0, calls, batch):
+            batch_calls = tool_calls[start : start + batch]
+            if hasattr(client, "use_tools"):
+                await client.use_tools(batch_calls)
+            else:
+                await asyncio.gather(
+                    *(client.use_tool(name, args) for name, args in batch_calls)
+                )
+        pipelined_time = time.perf_counter() - started_at
+    finally:
+        await client.disconnect()
+
+    latencies.sort()
+    return {
+        "connect_ms": connect_time * 1000,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "sequential_calls_per_s": calls / sum(latencies),
+        "pipelined_calls_per_s": calls / pipelined_time,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    stdio_client_class = load_stdio_client_class()
+    results = {
+        "stdio": await measure(
+            stdio_client_class(
+                name="benchmark_stdio",
+                command=sys.executable,
+                server_args=[str(SERVER_SCRIPT)],
+                env_vars={"FASTMCP_LOG_LEVEL": "WARNING"},
+            ),
+            args.calls,
+            args.batch,
+        )
+    }
+
+    server = start_http_server(args.port)
+    try:
+        results["http"] = await measure(
+            HTTPMCPClient(
+                name="benchmark_http",
+                server_url=f"http://127.0.0.1:{args.port}/mcp",
+            ),
+            args.calls,
+            args.batch,
+        )
+        async with HTTPTransportPool() as http_pool:
+            results["http_pooled"] = await measure(
+                HTTPMCPClient(
+                    name="benchmark_http_pooled",
+                    server_url=f"http://127.0.0.1:{args.port}/mcp",
+                    http_pool=http_pool,
+                ),
+                args.calls,
+                args.batch,
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+    metrics = list(results["stdio"])
+    print(f"{'':24}" + "".join(f"{transport:>14}" for transport in results))
+    for metric in metrics:
+        print(
+            f"{metric:24}"
+            + "".join(f"{results[transport][metric]:14.1f}" for transport in results)
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
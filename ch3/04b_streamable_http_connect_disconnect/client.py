@@ -1,53 +1,404 @@
-from contextlib import AsyncExitStack
-from typing import Any, Callable
+import asyncio
+import logging
+import random
+from collections.abc import Awaitable, Callable
+from contextlib import AsyncExitStack, suppress
+from typing import Any, TypeVar
 
+import anyio
+import httpx
+from connection_monitor import monitored_client_factory
+from http_pool import HTTPTransportPool
 from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
+from mcp.client.streamable_http import (
+    MCP_PROTOCOL_VERSION,
+    MCP_SESSION_ID,
+    streamablehttp_client,
+)
+from mcp.shared.exceptions import McpError
+from mcp.types import (
+    CONNECTION_CLOSED,
+    BlobResourceContents,
+    CallToolResult,
+    Prompt,
+    PromptMessage,
+    Resource,
+    ResourceTemplate,
+    TextResourceContents,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Error code streamablehttp_client reports when the server answers 404 because
+# it no longer knows the session ID
+SESSION_TERMINATED = 32600
+# Statuses servers use to reject an unknown session ID. The spec asks for 404,
+# but the Python SDK's server answers 400.
+SESSION_GONE_STATUSES = (400, 404)
+
+
+class Connection:
+    """
+    One streamable HTTP connection and its MCP session.
+
+    The transport runs its own task group, which has to be exited in the task
+    that entered it, so each connection is held open by a task of its own. That
+    also keeps a failed request from cancelling whichever task sent it.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: dict[str, str],
+        http_pool: HTTPTransportPool | None = None,
+    ) -> None:
+        self.url = url
+        self.headers = headers
+        self.http_pool = http_pool
+        self.session: ClientSession | None = None
+        self.session_id: str | None = None
+        self.protocol_version: str | None = None
+        # Set as soon as any request or stream on this connection fails
+        self.lost = asyncio.Event()
+        self._close = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def open(self, resume_from: "Connection | None" = None) -> None:
+        """
+        Connect and either initialize a new session or resume resume_from's
+        session, which is checked with a ping.
+        """
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._hold(ready, resume_from))
+        await ready
+
+    async def close(self) -> None:
+        self._close.set()
+        if self._task is not None:
+            await self._task
+
+    async def _hold(
+        self, ready: asyncio.Future[None], resume_from: "Connection | None"
+    ) -> None:
+        try:
+            async with AsyncExitStack() as stack:
+                # Sessions are terminated explicitly on disconnect, so dropping a
+                # connection never ends a session we want to resume
+                read, write, get_session_id = await stack.enter_async_context(
+                    streamablehttp_client(
+                        url=self.url,
+                        headers=self.headers,
+                        terminate_on_close=False,
+                        httpx_client_factory=monitored_client_factory(
+                            self.lost.set,
+                            self.http_pool.borrow() if self.http_pool else None,
+                        ),
+                    )
+                )
+                self.session = await stack.enter_async_context(
+                    ClientSession(read_stream=read, write_stream=write)
+                )
+                if resume_from is None:
+                    initialize_result = await self.session.initialize()
+                    self.session_id = get_session_id()
+                    self.protocol_version = initialize_result.protocolVersion
+                else:
+                    await self.session.send_ping()
+                    self.session_id = resume_from.session_id
+                    self.protocol_version = resume_from.protocol_version
+                ready.set_result(None)
+                await self._close.wait()
+        except Exception as error:
+            self.lost.set()
+            if not ready.done():
+                ready.set_exception(error)
+            else:
+                logger.debug(f"Connection to {self.url} closed: {error!r}")
 
 
 class MCPClient:
     """MCP Client class for connecting to and interacting with MCP servers."""
 
-    def __init__(self, name: str, server_url: str) -> None:
+    def __init__(
+        self,
+        name: str,
+        server_url: str,
+        max_reconnect_attempts: int = 6,
+        initial_backoff: float = 0.05,
+        max_backoff: float = 5.0,
+        http_pool: HTTPTransportPool | None = None,
+    ) -> None:
         """Initialize the MCPClient with server connection parameters."""
         self.name = name
         self.server_url = server_url
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        # Shared with other clients so sessions to the same host reuse connections
+        self.http_pool = http_pool
         self._session: ClientSession = None
-        self.exit_stack = AsyncExitStack()
+        self._connection: Connection | None = None
         self._connected: bool = False
-        self._get_session_id: Callable[[], str] = None
+        self._headers: dict[str, str] = {}
+        self._reconnect_lock = asyncio.Lock()
+
+    @property
+    def session_id(self) -> str | None:
+        return self._connection.session_id if self._connection else None
 
     async def connect(self, headers: dict | None = None) -> None:
         """Connect to the server set in the constructor."""
         if self._connected:
             raise RuntimeError("Client is already connected")
 
-        # Connect to Streamable HTTP server
-        streamable_connection = await self._exit_stack.enter_async_context(
-            streamablehttp_client(url=self.server_url, headers=headers)
+        self._headers = headers or {}
+        self._connection = await self._open_connection()
+        self._connected = True
+
+    async def _open_connection(
+        self, resume_from: Connection | None = None
+    ) -> Connection:
+        headers = dict(self._headers)
+        if resume_from is not None:
+            # Sending the old session ID makes the server carry on with the
+            # existing session instead of needing a new initialize handshake
+            headers[MCP_SESSION_ID] = resume_from.session_id
+            headers[MCP_PROTOCOL_VERSION] = resume_from.protocol_version
+        connection = Connection(self.server_url, headers, self.http_pool)
+        await connection.open(resume_from)
+        self._session = connection.session
+        return connection
+
+    async def _request(
+        self, operation: Callable[[ClientSession], Awaitable[T]]
+    ) -> T:
+        """
+        Send a request, and if the connection drops before its response arrives,
+        reconnect and send it again.
+
+        The server may already have acted on a request whose response was lost, so
+        requests replayed this way should be safe to repeat.
+        """
+        if not self._connected:
+            raise RuntimeError("Client not connected to a server")
+
+        while True:
+            connection = self._connection
+            request = asyncio.create_task(operation(connection.session))
+            lost = asyncio.create_task(connection.lost.wait())
+            try:
+                await asyncio.wait(
+                    {request, lost}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                lost.cancel()
+                if not request.done():
+                    request.cancel()
+                    with suppress(asyncio.CancelledError, Exception):
+                        await request
+
+            if request.done() and not request.cancelled():
+                error = request.exception()
+                if error is None:
+                    return request.result()
+                if not _is_connection_error(error):
+                    raise error
+
+            logger.info(f"Connection to {self.server_url} lost, reconnecting")
+            await self._reconnect(connection)
+
+    async def _reconnect(self, failed: Connection) -> None:
+        """
+        Replace a failed connection, resuming its session with exponential backoff.
+        Only if the server no longer knows the session is a new one started.
+        """
+        async with self._reconnect_lock:
+            # Every request on the failed connection lands here, but only the
+            # first needs to reconnect
+            if self._connection is not failed:
+                return
+            await failed.close()
+
+            resume_from = failed
+            backoff = self.initial_backoff
+            for attempt in range(1, self.max_reconnect_attempts + 1):
+                try:
+                    self._connection = await self._open_connection(resume_from)
+                except Exception as error:
+                    if resume_from is not None and _is_session_gone(error):
+                        logger.warning(
+                            f"Session {failed.session_id} has ended, starting a new one"
+                        )
+                        resume_from = None
+                        continue
+                    logger.debug(f"Reconnect attempt {attempt} failed: {error!r}")
+                    # Full jitter, so many clients do not retry in lockstep
+                    await asyncio.sleep(random.uniform(0, backoff))
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                logger.info(
+                    f"Reconnected to session {self.session_id} after "
+                    f"{attempt} attempt(s)"
+                )
+                return
+
+            self._connected = False
+            raise ConnectionError(
+                f"Could not reconnect to {self.server_url} after "
+                f"{self.max_reconnect_attempts} attempts"
+            )
+
+    async def use_tool(
+        self, tool_name: str, arguments: dict[str, Any] | None = None
+    ) -> list[str]:
+        tool_call_result = await self._request(
+            lambda session: session.call_tool(name=tool_name, arguments=arguments)
         )
-        self.read, self.write, self._get_session_id = streamable_connection
+        logger.debug(f"Calling tool {tool_name} with arguments {arguments}")
+        return self._tool_result_contents(tool_name, tool_call_result)
 
-        # Start MCP client session
-        self._session = await self._exit_stack.enter_async_context(
-            ClientSession(read_stream=self.read, write_stream=self.write)
+    async def use_tools(
+        self, tool_calls: list[tuple[str, dict[str, Any] | None]]
+    ) -> list[list[str]]:
+        """
+        Call several tools at once. Every request is sent before any response is
+        awaited, so the calls run concurrently on the server instead of each
+        waiting a full round trip for the one before it. Results are returned in
+        the order of tool_calls.
+        """
+        return await asyncio.gather(
+            *(
+                self.use_tool(tool_name, arguments)
+                for tool_name, arguments in tool_calls
+            )
         )
 
-        # Initialize session
-        await self._session.initialize()
-        self._connected = True
+    def _tool_result_contents(
+        self, tool_name: str, tool_call_result: CallToolResult
+    ) -> list[str]:
+        results = []
+        if tool_call_result.content:
+            for content in tool_call_result.content:
+                match content.type:
+                    case "text":
+                        results.append(content.text)
+                    case "image" | "audio":
+                        results.append(content.data)
+                    case "resource":
+                        if isinstance(content.resource, TextResourceContents):
+                            results.append(content.resource.text)
+                        else:
+                            results.append(content.resource.blob)
+        else:
+            logger.warning(f"No content in tool call result for tool {tool_name}")
+        return results
+
+    async def get_resource(
+        self, uri: str
+    ) -> list[BlobResourceContents | TextResourceContents]:
+        resource_read_result = await self._request(
+            lambda session: session.read_resource(uri=uri)
+        )
+
+        if not resource_read_result.contents:
+            logger.warning(f"No content read for resource URI {uri}")
+        return resource_read_result.contents
+
+    async def load_prompt(
+        self, name: str, arguments: dict[str, str]
+    ) -> list[PromptMessage]:
+        prompt_load_result = await self._request(
+            lambda session: session.get_prompt(name=name, arguments=arguments)
+        )
+
+        if not prompt_load_result.messages:
+            logger.warning(f"No prompt found for prompt {name}")
+        else:
+            logger.debug(
+                f"Loaded prompt {name} with description {prompt_load_result.description}"
+            )
+        return prompt_load_result.messages
 
-    async def get_available_tools(self) -> list[Any]:
-        """Retrieve tools that the server has made available."""
-        pass
+    async def get_available_resources(self) -> list[Resource]:
+        resources_result = await self._request(
+            lambda session: session.list_resources()
+        )
+        if not resources_result.resources:
+            logger.warning("No resources found on server")
+        return resources_result.resources
+
+    async def get_available_resource_templates(self) -> list[ResourceTemplate]:
+        resource_templates_result = await self._request(
+            lambda session: session.list_resource_templates()
+        )
+        if not resource_templates_result.resourceTemplates:
+            logger.warning("No resource templates found on server")
+        return resource_templates_result.resourceTemplates
 
-    async def use_tool(self, tool_name: str, tool_args: list | None = None):
-        """Given a tool name and optionally a list of argumnents, execute the tool."""
-        pass
+    async def get_available_tools(self) -> list[dict[str, Any]]:
+        tools_result = await self._request(lambda session: session.list_tools())
+        if not tools_result.tools:
+            logger.warning("No tools found on server")
+        available_tools = [
+            {
+                "name": tool.name,
+                "description": tool.description,
+                "input_schema": tool.inputSchema,
+            }
+            for tool in tools_result.tools
+        ]
+        return available_tools
+
+    async def get_available_prompts(self) -> list[Prompt]:
+        prompt_result = await self._request(lambda session: session.list_prompts())
+        if not prompt_result.prompts:
+            logger.warning("No prompts found on server")
+        return prompt_result.prompts
 
     async def disconnect(self) -> None:
         """Clean up any resources."""
-        if self._exit_stack:
-            await self._exit_stack.aclose()
-            self._connected = False
-            self._session = None
+        if self._connection:
+            await self._connection.close()
+            await self._terminate_session(self._connection)
+            self._connection = None
+        self._connected = False
+        self._session = None
+
+    async def _terminate_session(self, connection: Connection) -> None:
+        """Tell the server the session is over, as the transport no longer does."""
+        if not connection.session_id:
+            return
+        headers = {
+            **self._headers,
+            MCP_SESSION_ID: connection.session_id,
+            MCP_PROTOCOL_VERSION: connection.protocol_version,
+        }
+        try:
+            transport = self.http_pool.borrow() if self.http_pool else None
+            async with httpx.AsyncClient(transport=transport) as http_client:
+                await http_client.delete(self.server_url, headers=headers)
+        except httpx.HTTPError as error:
+            logger.warning(f"Could not terminate session: {error!r}")
+
+
+def _is_session_gone(error: BaseException) -> bool:
+    """Whether resuming failed because the server no longer has the session."""
+    if isinstance(error, McpError):
+        return error.error.code == SESSION_TERMINATED
+    if isinstance(error, ExceptionGroup):
+        return any(_is_session_gone(inner) for inner in error.exceptions)
+    return (
+        isinstance(error, httpx.HTTPStatusError)
+        and error.response.status_code in SESSION_GONE_STATUSES
+    )
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    return isinstance(
+        error,
+        httpx.TransportError | anyio.ClosedResourceError | anyio.BrokenResourceError,
+    )
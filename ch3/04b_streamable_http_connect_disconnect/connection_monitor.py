@@ -0,0 +1,77 @@
+from collections.abc import AsyncIterator, Callable
+from typing import Any
+
+import httpx
+
+
+class MonitoredTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that calls on_lost when a request fails or a response stream
+    breaks partway through.
+
+    The streamable HTTP client transport only logs a broken response stream, which
+    leaves the request it was answering waiting forever. Watching the HTTP layer
+    directly is how the client finds out that the connection dropped.
+    """
+
+    def __init__(
+        self,
+        on_lost: Callable[[], None],
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self._transport = transport or httpx.AsyncHTTPTransport()
+        self._on_lost = on_lost
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError:
+            self._on_lost()
+            raise
+        response.stream = MonitoredStream(response.stream, self._on_lost)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class MonitoredStream(httpx.AsyncByteStream):
+    def __init__(self, stream: Any, on_lost: Callable[[], None]) -> None:
+        self._stream = stream
+        self._on_lost = on_lost
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except httpx.TransportError:
+            self._on_lost()
+            raise
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+def monitored_client_factory(
+    on_lost: Callable[[], None],
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> Callable[..., httpx.AsyncClient]:
+    """
+    Build an httpx_client_factory for streamablehttp_client whose clients report
+    lost connections to on_lost, sending requests through transport if given.
+    """
+
+    def create_client(
+        headers: dict[str, str] | None = None,
+        timeout: httpx.Timeout | None = None,
+        auth: httpx.Auth | None = None,
+    ) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            headers=headers,
+            timeout=timeout or httpx.Timeout(30.0),
+            auth=auth,
+            follow_redirects=True,
+            transport=MonitoredTransport(on_lost, transport),
+        )
+
+    return create_client
@@ -0,0 +1,116 @@
+import importlib.util
+from collections.abc import AsyncIterator
+from typing import Any
+
+import anyio
+import httpx
+
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+# How long to wait for the rest of a response body that is closed early before
+# giving up on reusing its connection
+DRAIN_TIMEOUT = 0.05
+
+
+class HTTPTransportPool(httpx.AsyncBaseTransport):
+    """
+    HTTP connection pool to share between MCPClient instances.
+
+    Without it every streamable HTTP session opens its own connections, so many
+    sessions with servers on one host each pay for their own TCP and TLS
+    handshakes. The pool keeps a separate set of keep-alive connections per host
+    (scheme, host and port) with its own connection limit, so one busy host
+    cannot use up the connections meant for the others. When h2 is installed,
+    HTTP/2 is negotiated with servers that support it over TLS, and requests
+    from all sessions to that host are multiplexed over a single connection.
+
+    Over HTTP/1.1 each session's server-to-client SSE stream holds a connection
+    open for as long as the session lasts, so max_connections_per_host must
+    leave room for those on top of the concurrent requests.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = 200,
+        max_keepalive_per_host: int = 100,
+        keepalive_expiry: float = 30.0,
+        http2: bool | None = None,
+    ) -> None:
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_per_host,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self._transports: dict[
+            tuple[str, str, int | None], httpx.AsyncHTTPTransport
+        ] = {}
+
+    def borrow(self) -> "BorrowedTransport":
+        """
+        A transport for one httpx client that sends requests through the pool.
+        httpx closes a client's transport when the client closes, so clients
+        must be given one of these rather than the pool itself.
+        """
+        return BorrowedTransport(self)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = request.url
+        origin = (url.scheme, url.host, url.port)
+        if origin not in self._transports:
+            self._transports[origin] = httpx.AsyncHTTPTransport(
+                limits=self.limits, http2=self.http2
+            )
+        response = await self._transports[origin].handle_async_request(request)
+        response.stream = DrainingStream(response.stream)
+        return response
+
+    async def aclose(self) -> None:
+        for transport in self._transports.values():
+            await transport.aclose()
+        self._transports.clear()
+
+
+class BorrowedTransport(httpx.AsyncBaseTransport):
+    """Sends requests through an HTTPTransportPool and leaves it open on close."""
+
+    def __init__(self, pool: HTTPTransportPool) -> None:
+        self._pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._pool.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class DrainingStream(httpx.AsyncByteStream):
+    """
+    Response stream that reads what is left of the body when closed early.
+
+    The streamable HTTP client closes an SSE response as soon as the JSON-RPC
+    response it was waiting for arrives, just before the server ends the
+    stream. An HTTP/1.1 connection whose response was not read to the end
+    cannot be reused, so without draining every request would open a new
+    connection.
+    """
+
+    def __init__(self, stream: Any) -> None:
+        self._stream = stream
+        self._finished = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+        self._finished = True
+
+    async def aclose(self) -> None:
+        try:
+            if not self._finished:
+                with anyio.move_on_after(DRAIN_TIMEOUT):
+                    async for _ in self._stream:
+                        pass
+        except httpx.HTTPError:
+            pass
+        finally:
+            await self._stream.aclose()
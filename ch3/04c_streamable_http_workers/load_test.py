@@ -0,0 +1,210 @@
+"""
+Load test a streamable HTTP MCP server with many concurrent agents, on this
+machine only. Each agent opens its own session, calls a tool repeatedly and
+disconnects.
+
+    python load_test.py --workers 1 2 4 --agents 200 --calls 20
+    python load_test.py --url http://127.0.0.1:8000/mcp --agents 200
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+logger = logging.getLogger(__name__)
+
+SERVE_SCRIPT = Path(__file__).parent / "serve_http.py"
+
+
+class Results:
+    def __init__(self) -> None:
+        self.connect_latencies: list[float] = []
+        self.call_latencies: list[float] = []
+        self.errors: Counter[str] = Counter()
+        self.sessions_per_worker: Counter[str] = Counter()
+
+
+async def run_agent(
+    url: str,
+    tool: str,
+    arguments: dict,
+    calls: int,
+    start_delay: float,
+    results: Results,
+) -> None:
+    await asyncio.sleep(start_delay)
+    try:
+        started_at = time.perf_counter()
+        async with (
+            streamablehttp_client(url) as (read, write, get_session_id),
+            ClientSession(read, write) as session,
+        ):
+            await session.initialize()
+            results.connect_latencies.append(time.perf_counter() - started_at)
+            session_id = get_session_id()
+            # serve_http.py prefixes session IDs with the worker's index
+            results.sessions_per_worker[session_id.partition(".")[0]] += 1
+
+            for _ in range(calls):
+                started_at = time.perf_counter()
+                result = await session.call_tool(tool, arguments)
+                results.call_latencies.append(time.perf_counter() - started_at)
+                if result.isError:
+                    results.errors["tool error"] += 1
+    except Exception as error:
+        logger.debug("Agent failed", exc_info=True)
+        results.errors[type(error).__name__] += 1
+
+
+async def load_test(
+    url: str, agents: int, calls: int, tool: str, arguments: dict, ramp_up: float
+) -> dict:
+    results = Results()
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *(
+            run_agent(
+                url, tool, arguments, calls, random.uniform(0, ramp_up), results
+            )
+            for _ in range(agents)
+        )
+    )
+    elapsed = time.perf_counter() - started_at
+    return {
+        "agents": agents,
+        "calls": len(results.call_latencies),
+        "errors": dict(results.errors),
+        "sessions_per_worker": dict(sorted(results.sessions_per_worker.items())),
+        "connect_p50_ms": _percentile(results.connect_latencies, 0.5),
+        "connect_p99_ms": _percentile(results.connect_latencies, 0.99),
+        "call_p50_ms": _percentile(results.call_latencies, 0.5),
+        "call_p99_ms": _percentile(results.call_latencies, 0.99),
+        "calls_per_s": len(results.call_latencies) / elapsed,
+    }
+
+
+def _percentile(latencies: list[float], fraction: float) -> float | None:
+    if not latencies:
+        return None
+    if fraction == 0.5:
+        return statistics.median(latencies) * 1000
+    latencies = sorted(latencies)
+    return latencies[max(int(len(latencies) * fraction) - 1, 0)] * 1000
+
+
+def start_server(
+    server: Path, workers: int, port: int, stateless_tools: bool = False
+) -> subprocess.Popen:
+    command = [
+        sys.executable,
+        str(SERVE_SCRIPT),
+        str(server),
+        "--workers",
+        str(workers),
+        "--port",
+        str(port),
+    ]
+    if stateless_tools:
+        command.append("--stateless-tools")
+    process = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve_http.py exited with {process.returncode}")
+        with socket.socket() as probe:
+            if probe.connect_ex(("127.0.0.1", port)) == 0:
+                return process
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("serve_http.py did not start")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", help="Test a server that is already running")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="Worker counts to start serve_http.py with, one run each",
+    )
+    parser.add_argument(
+        "--server",
+        type=Path,
+        default=Path(__file__).parent.parent / "calculator_server.py",
+    )
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument(
+        "--stateless-tools",
+        action="store_true",
+        help="Start serve_http.py with its stateless tool path",
+    )
+    parser.add_argument("--agents", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--tool", default="add")
+    parser.add_argument("--arguments", type=json.loads, default={"a": 1, "b": 2})
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        default=1.0,
+        help="Seconds over which agents start",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    runs = {}
+    if args.url:
+        runs["external"] = await load_test(
+            args.url,
+            args.agents,
+            args.calls,
+            args.tool,
+            args.arguments,
+            args.ramp_up,
+        )
+    else:
+        for workers in args.workers:
+            server = start_server(
+                args.server, workers, args.port, args.stateless_tools
+            )
+            try:
+                runs[f"{workers} workers"] = await load_test(
+                    f"http://127.0.0.1:{args.port}/mcp",
+                    args.agents,
+                    args.calls,
+                    args.tool,
+                    args.arguments,
+                    args.ramp_up,
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return
+    for name, run in runs.items():
+        print(f"{name}:")
+        for metric, value in run.items():
+            if isinstance(value, float):
+                value = f"{value:.1f}"
+            print(f"  {metric:20} {value}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
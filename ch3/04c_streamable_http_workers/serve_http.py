@@ -0,0 +1,433 @@
+"""
+Serve a FastMCP server over streamable HTTP from several worker processes.
+
+    python serve_http.py ../calculator_server.py --workers 4 --port 8000
+
+Clients connect to http://127.0.0.1:8000/mcp. A front proxy starts each new
+session on the worker with the fewest sessions and sends every later request
+for that session to the same worker, so any number of agents can share a few
+server processes.
+
+With --stateless-tools, workers answer calls to tools that do not need their
+session (see stateless_tools.py) without going through the session.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import logging
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import suppress
+from pathlib import Path
+
+import httpx
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+from mcp.server.streamable_http import MCP_SESSION_ID_HEADER
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from stateless_tools import StatelessToolMiddleware
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVER = Path(__file__).parent.parent / "calculator_server.py"
+# Headers that only apply to one hop and must not be passed through the proxy
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+}
+# Separates the worker index the proxy adds from the worker's own session ID
+SESSION_PREFIX_SEPARATOR = "."
+
+
+class Worker:
+    """One server process, listening on a local port only the proxy uses."""
+
+    def __init__(self, index: int, port: int, worker_args: list[str]) -> None:
+        self.index = index
+        self.port = port
+        # Passed on to serve_http.py to run the worker
+        self.worker_args = worker_args
+        self.url = f"http://127.0.0.1:{port}"
+        # Sessions started on this worker and when each was last used, used to
+        # balance new sessions
+        self.sessions: dict[str, float] = {}
+        # Responses still streaming for each session, such as an open SSE stream
+        self.open_requests: Counter[str] = Counter()
+        # Sessions being initialized, not yet given an ID by the worker
+        self.starting = 0
+        self.process: subprocess.Popen | None = None
+        self.listening = False
+
+    def start(self) -> None:
+        self.sessions.clear()
+        self.open_requests.clear()
+        self.listening = False
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                __file__,
+                "--worker-port",
+                str(self.port),
+                *self.worker_args,
+            ]
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def routable(self) -> bool:
+        """Running and known to be accepting connections."""
+        return self.alive and self.listening
+
+    def request_started(self, session_id: str) -> None:
+        self.sessions[session_id] = time.monotonic()
+        self.open_requests[session_id] += 1
+
+    def request_finished(self, session_id: str) -> None:
+        self.open_requests[session_id] -= 1
+        if self.open_requests[session_id] <= 0:
+            del self.open_requests[session_id]
+        if session_id in self.sessions:
+            self.sessions[session_id] = time.monotonic()
+
+    def expire_sessions(self, idle_timeout: float) -> None:
+        """
+        Stop counting sessions with no open responses that have not been used for
+        idle_timeout seconds. Clients that go away without a DELETE leave their
+        sessions behind, and would otherwise skew the balancing for good.
+        """
+        cutoff = time.monotonic() - idle_timeout
+        for session_id, last_used in list(self.sessions.items()):
+            if last_used < cutoff and session_id not in self.open_requests:
+                del self.sessions[session_id]
+
+    async def wait_ready(self, timeout: float = 30.0) -> None:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while asyncio.get_running_loop().time() < deadline:
+            if not self.alive:
+                raise RuntimeError(f"Worker {self.index} exited during startup")
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.port)
+            except OSError:
+                await asyncio.sleep(0.1)
+                continue
+            writer.close()
+            await writer.wait_closed()
+            self.listening = True
+            return
+        raise RuntimeError(f"Worker {self.index} did not start in {timeout}s")
+
+    def stop(self) -> None:
+        if self.alive:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class WorkerProxy:
+    """
+    Routes streamable HTTP requests to workers by session.
+
+    A worker's session IDs are prefixed with the worker's index on the way out
+    and stripped on the way back in, so the route for a session is carried in
+    the session ID itself and survives a proxy restart. The session counts kept
+    per worker are only used to pick a worker for new sessions, so a session
+    idle for session_idle_timeout seconds stops being counted, and is counted
+    again if it is used again.
+    """
+
+    def __init__(
+        self, workers: list[Worker], session_idle_timeout: float = 600.0
+    ) -> None:
+        self.workers = workers
+        self.session_idle_timeout = session_idle_timeout
+        # SSE streams stay open for the whole session, so reads never time out
+        self._http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, read=None),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=200),
+        )
+
+    async def aclose(self) -> None:
+        await self._http_client.aclose()
+
+    def choose_worker(self) -> Worker | None:
+        workers = [worker for worker in self.workers if worker.routable]
+        if not workers:
+            return None
+        for worker in workers:
+            worker.expire_sessions(self.session_idle_timeout)
+        return min(
+            workers, key=lambda worker: len(worker.sessions) + worker.starting
+        )
+
+    async def handle(self, request: Request) -> Response:
+        session_header = request.headers.get(MCP_SESSION_ID_HEADER)
+        session_id = None
+        if session_header is None:
+            worker = self.choose_worker()
+            if worker is None:
+                return Response("No workers available", status_code=503)
+        else:
+            worker, session_id = self._parse_session_header(session_header)
+            if worker is None:
+                return _session_not_found()
+
+        headers = [
+            (name, value)
+            for name, value in request.headers.items()
+            if name not in HOP_BY_HOP_HEADERS and name != MCP_SESSION_ID_HEADER
+        ]
+        if session_id is not None:
+            headers.append((MCP_SESSION_ID_HEADER, session_id))
+
+        upstream_request = self._http_client.build_request(
+            request.method,
+            worker.url + request.url.path,
+            params=request.query_params,
+            headers=headers,
+            content=await request.body(),
+        )
+        if session_id is None:
+            worker.starting += 1
+        try:
+            upstream = await self._http_client.send(upstream_request, stream=True)
+        except httpx.TransportError as error:
+            logger.warning(f"Worker {worker.index} unreachable: {error!r}")
+            return Response("Worker unavailable", status_code=503)
+        finally:
+            if session_id is None:
+                worker.starting -= 1
+
+        upstream_session_id = upstream.headers.get(MCP_SESSION_ID_HEADER)
+        tracked_session_id = upstream_session_id or session_id
+        if session_id is not None and (
+            request.method == "DELETE" or upstream.status_code in (400, 404)
+        ):
+            # Terminated, or the worker no longer knows the session
+            worker.sessions.pop(session_id, None)
+            tracked_session_id = None
+        if tracked_session_id is not None:
+            worker.request_started(tracked_session_id)
+
+        async def close_upstream() -> None:
+            await upstream.aclose()
+            if tracked_session_id is not None:
+                worker.request_finished(tracked_session_id)
+
+        response_headers = {
+            name: value
+            for name, value in upstream.headers.items()
+            if name not in HOP_BY_HOP_HEADERS and name != MCP_SESSION_ID_HEADER
+        }
+        if upstream_session_id is not None:
+            response_headers[MCP_SESSION_ID_HEADER] = (
+                f"{worker.index}{SESSION_PREFIX_SEPARATOR}{upstream_session_id}"
+            )
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            headers=response_headers,
+            background=BackgroundTask(close_upstream),
+        )
+
+    def _parse_session_header(self, header: str) -> tuple[Worker | None, str]:
+        index, separator, session_id = header.partition(SESSION_PREFIX_SEPARATOR)
+        if not separator or not index.isdigit() or int(index) >= len(self.workers):
+            return None, header
+        worker = self.workers[int(index)]
+        # A restarted worker has lost its sessions
+        if not worker.routable:
+            return None, session_id
+        return worker, session_id
+
+
+def _session_not_found() -> Response:
+    return JSONResponse(
+        {
+            "jsonrpc": "2.0",
+            "id": "server-error",
+            "error": {"code": -32600, "message": "Session not found"},
+        },
+        status_code=404,
+    )
+
+
+def load_server(server_path: Path, server_name: str) -> FastMCP:
+    # The server directories are not packages, so load the server by path
+    sys.path.insert(0, str(server_path.parent))
+    spec = importlib.util.spec_from_file_location(server_path.stem, server_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, server_name)
+
+
+def run_worker(
+    server_path: Path, server_name: str, port: int, stateless_tools: bool
+) -> None:
+    mcp = load_server(server_path, server_name)
+    # Per-request logs from every worker would swamp the proxy's output
+    logging.getLogger().setLevel(logging.WARNING)
+    app = mcp.streamable_http_app()
+    if stateless_tools:
+        app = StatelessToolMiddleware(app, mcp)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+async def supervise(workers: list[Worker], interval: float = 1.0) -> None:
+    """
+    Restart workers that exit. Their sessions are lost and must start again. A
+    restarted worker gets no requests until it accepts connections.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for worker in workers:
+            if not worker.alive:
+                logger.warning(
+                    f"Worker {worker.index} exited with "
+                    f"{worker.process.returncode}, restarting"
+                )
+                worker.start()
+                try:
+                    await worker.wait_ready()
+                except RuntimeError as error:
+                    # Stopped if it is still starting, and tried again next round
+                    logger.warning(str(error))
+                    worker.stop()
+
+
+async def serve(
+    server_path: Path,
+    server_name: str,
+    workers: int,
+    host: str,
+    port: int,
+    stateless_tools: bool = False,
+    session_idle_timeout: float = 600.0,
+) -> None:
+    worker_args = [str(server_path), "--server-name", server_name]
+    if stateless_tools:
+        worker_args.append("--stateless-tools")
+    pool = [Worker(index, free_port(), worker_args) for index in range(workers)]
+    for worker in pool:
+        worker.start()
+    try:
+        await asyncio.gather(*(worker.wait_ready() for worker in pool))
+        proxy = WorkerProxy(pool, session_idle_timeout)
+        app = Starlette(
+            routes=[
+                Route(
+                    "/{path:path}",
+                    proxy.handle,
+                    methods=["GET", "POST", "DELETE"],
+                )
+            ]
+        )
+        server = uvicorn.Server(
+            uvicorn.Config(
+                app,
+                host=host,
+                port=port,
+                log_level="warning",
+                # Open SSE streams would otherwise hold up shutdown for good
+                timeout_graceful_shutdown=5,
+            )
+        )
+        supervisor = asyncio.create_task(supervise(pool))
+        logger.info(
+            f"Serving {server_path.name} on {host}:{port} with {workers} workers"
+        )
+        try:
+            await server.serve()
+        finally:
+            supervisor.cancel()
+            await proxy.aclose()
+    finally:
+        for worker in pool:
+            worker.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("server", nargs="?", type=Path, default=DEFAULT_SERVER)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--server-name",
+        default="mcp",
+        help="Name of the FastMCP instance in the server module",
+    )
+    parser.add_argument(
+        "--stateless-tools",
+        action="store_true",
+        help="Answer calls to tools that do not need their session directly",
+    )
+    parser.add_argument(
+        "--session-idle-timeout",
+        type=float,
+        default=600.0,
+        help="Seconds after which an unused session stops counting towards its "
+        "worker's load",
+    )
+    parser.add_argument("--worker-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    server_path = args.server.resolve()
+
+    if args.worker_port is not None:
+        run_worker(
+            server_path, args.server_name, args.worker_port, args.stateless_tools
+        )
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # uvicorn re-raises the signal it stopped for once it has shut down. Turning
+    # SIGTERM into KeyboardInterrupt, like SIGINT, lets serve() stop the workers
+    # instead of the process dying and leaving them running.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with suppress(KeyboardInterrupt):
+        asyncio.run(
+            serve(
+                server_path,
+                args.server_name,
+                args.workers,
+                args.host,
+                args.port,
+                args.stateless_tools,
+                args.session_idle_timeout,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
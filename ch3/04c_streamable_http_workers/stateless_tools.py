@@ -0,0 +1,263 @@
+import ast
+import inspect
+import json
+import logging
+import textwrap
+from collections.abc import Callable
+from typing import Any
+
+from mcp import types
+from mcp.server.fastmcp import FastMCP
+from mcp.server.lowlevel.server import request_ctx
+from mcp.server.streamable_http import (
+    CONTENT_TYPE_JSON,
+    CONTENT_TYPE_SSE,
+    DEFAULT_NEGOTIATED_VERSION,
+    MCP_PROTOCOL_VERSION_HEADER,
+    MCP_SESSION_ID_HEADER,
+    SUPPORTED_PROTOCOL_VERSIONS,
+)
+from mcp.server.transport_security import TransportSecurityMiddleware
+from mcp.shared.context import RequestContext
+from mcp.shared.exceptions import McpError
+from pydantic import ValidationError
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Context methods that only send a log message about the current request
+LOGGING_METHODS = frozenset({"debug", "info", "warning", "error", "log"})
+
+
+def find_stateless_tools(mcp: FastMCP) -> set[str]:
+    """
+    Names of the tools that never need their session: those without a Context
+    parameter, and those that only use it to log.
+    """
+    return {
+        tool.name
+        for tool in mcp._tool_manager.list_tools()
+        if tool.context_kwarg is None or _only_logs(tool.fn, tool.context_kwarg)
+    }
+
+
+def _only_logs(fn: Callable[..., Any], context_name: str) -> bool:
+    """Whether every use of the context parameter in fn is a logging method."""
+    try:
+        source = textwrap.dedent(inspect.getsource(fn))
+    except (OSError, TypeError):
+        return False
+    function = ast.parse(source).body[0]
+    logging_uses = {
+        id(node.value)
+        for node in ast.walk(function)
+        if isinstance(node, ast.Attribute)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == context_name
+        and node.attr in LOGGING_METHODS
+    }
+    return all(
+        id(node) in logging_uses
+        for node in ast.walk(function)
+        if isinstance(node, ast.Name) and node.id == context_name
+    )
+
+
+class LogCollector:
+    """Stands in for a tool's ServerSession, keeping the log messages it sends."""
+
+    def __init__(self) -> None:
+        self.notifications: list[types.JSONRPCNotification] = []
+
+    async def send_log_message(
+        self,
+        level: types.LoggingLevel,
+        data: Any,
+        logger: str | None = None,
+        related_request_id: types.RequestId | None = None,
+    ) -> None:
+        notification = types.LoggingMessageNotification(
+            params=types.LoggingMessageNotificationParams(
+                level=level, data=data, logger=logger
+            )
+        )
+        self.notifications.append(
+            types.JSONRPCNotification(
+                jsonrpc="2.0",
+                **notification.model_dump(
+                    by_alias=True, mode="json", exclude_none=True
+                ),
+            )
+        )
+
+
+class StatelessToolMiddleware:
+    """
+    Answers calls to stateless tools without going through their session.
+
+    Every request on a streamable HTTP session is looked up by session ID,
+    handed to the session's task through memory streams and answered over an
+    SSE stream set up for it. Calls to tools that never need their session are
+    run here instead, straight from the request body, and answered with one
+    plain response: JSON, or a short event stream when the tool logged. Every
+    other request, including calls to tools that sample, elicit or ask for
+    roots, is passed on to the session as usual.
+
+    Only requests for a live session of this server take this path, so clients
+    still initialize first, and only once they pass the checks the session's
+    transport would make: DNS rebinding protection, the Accept header and the
+    protocol version. Any other request goes to the session, which answers it
+    with the usual error. Create the middleware after mcp.streamable_http_app(),
+    which sets up the session manager.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        mcp: FastMCP,
+        path: str | None = None,
+        tools: set[str] | None = None,
+    ) -> None:
+        self.app = app
+        self.path = path or mcp.settings.streamable_http_path
+        self.tools = find_stateless_tools(mcp) if tools is None else tools
+        self._call_tool = mcp._mcp_server.request_handlers[types.CallToolRequest]
+        self._session_manager = mcp.session_manager
+        self._security = TransportSecurityMiddleware(mcp.settings.transport_security)
+        logger.info(f"Stateless tools: {', '.join(sorted(self.tools))}")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] != self.path
+            or not await self._passes_transport_checks(Request(scope, receive))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        request = self._parse_stateless_call(body)
+        if request is None:
+            await self.app(scope, _replay_body(body, receive), send)
+            return
+
+        response = await self._handle(request)
+        await response(scope, receive, send)
+
+    async def _passes_transport_checks(self, request: Request) -> bool:
+        """
+        Whether a POST is for a live session and would get past the checks its
+        transport makes before handling the body.
+        """
+        transport = self._session_manager._server_instances.get(
+            request.headers.get(MCP_SESSION_ID_HEADER)
+        )
+        if transport is None or transport.is_terminated:
+            return False
+        if await self._security.validate_request(request, is_post=True):
+            return False
+        accepted = [
+            media_type.strip()
+            for media_type in request.headers.get("accept", "").split(",")
+        ]
+        if not (
+            any(media_type.startswith(CONTENT_TYPE_JSON) for media_type in accepted)
+            and any(
+                media_type.startswith(CONTENT_TYPE_SSE) for media_type in accepted
+            )
+        ):
+            return False
+        return (
+            request.headers.get(
+                MCP_PROTOCOL_VERSION_HEADER, DEFAULT_NEGOTIATED_VERSION
+            )
+            in SUPPORTED_PROTOCOL_VERSIONS
+        )
+
+    def _parse_stateless_call(self, body: bytes) -> types.JSONRPCRequest | None:
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return None
+        if (
+            not isinstance(message, dict)
+            or message.get("method") != "tools/call"
+            or not isinstance(message.get("params"), dict)
+            or message["params"].get("name") not in self.tools
+        ):
+            return None
+        try:
+            return types.JSONRPCRequest.model_validate(message)
+        except ValidationError:
+            return None
+
+    async def _handle(self, message: types.JSONRPCRequest) -> Response:
+        request = types.CallToolRequest.model_validate(
+            message.model_dump(by_alias=True, mode="json", exclude_none=True)
+        )
+        session = LogCollector()
+        token = request_ctx.set(
+            RequestContext(message.id, request.params.meta, session, None)
+        )
+        try:
+            result = await self._call_tool(request)
+            response = types.JSONRPCResponse(
+                jsonrpc="2.0",
+                id=message.id,
+                result=result.model_dump(
+                    by_alias=True, mode="json", exclude_none=True
+                ),
+            )
+        except McpError as error:
+            response = types.JSONRPCError(
+                jsonrpc="2.0", id=message.id, error=error.error
+            )
+        except Exception as error:
+            logger.exception(f"Stateless call to {request.params.name} failed")
+            response = types.JSONRPCError(
+                jsonrpc="2.0",
+                id=message.id,
+                error=types.ErrorData(code=0, message=str(error)),
+            )
+        finally:
+            request_ctx.reset(token)
+
+        if not session.notifications:
+            return Response(
+                response.model_dump_json(by_alias=True, exclude_none=True),
+                media_type="application/json",
+            )
+        events = "".join(
+            f"event: message\ndata: "
+            f"{event.model_dump_json(by_alias=True, exclude_none=True)}\n\n"
+            for event in [*session.notifications, response]
+        )
+        return Response(events, media_type="text/event-stream")
+
+
+async def _read_body(receive: Receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return body
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+def _replay_body(body: bytes, receive: Receive) -> Receive:
+    """A receive callable that gives the already read body again, then waits."""
+    sent = False
+
+    async def replay() -> Message:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
@@ -1,6 +1,8 @@
 import json
 import logging
+import sys
 from contextlib import AsyncExitStack
+from pathlib import Path
 from typing import Any
 
 from anthropic import Anthropic
@@ -22,10 +24,14 @@ from mcp.types import (
     Resource,
     ResourceTemplate,
     Root,
-    TextContent,
     TextResourceContents,
 )
 
+# The sampling adapter is shared by the chapter's clients, so it lives next to
+# the calculator server
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from sampling_adapter import to_anthropic_request, to_create_message_result
+
 logger = logging.getLogger(__name__)
 
 
@@ -64,45 +70,10 @@ class MCPClient:
         Sampling handler that passes the server's prompt to the LLM client, implementing
         the SamplingFnT protocol, which is why the unused context parameter is included.
         """
-        messages = []
-        for message in params.messages:
-            if isinstance(message.content, TextContent):
-                messages.append(
-                    {"role": message.role, "content": message.content.text}
-                )
-            else:
-                # Handle other content types if needed
-                messages.append(
-                    {"role": message.role, "content": str(message.content)}
-                )
-
         response = self._llm_client.messages.create(
-            max_tokens=params.maxTokens,
-            messages=messages,
-            model="claude-sonnet-4-0",
-        )
-
-        # Extract content from the response - content is a list of content blocks
-        if response.content and len(response.content) > 0:
-            content = response.content[0]
-            if hasattr(content, "text"):
-                content_data = TextContent(type="text", text=content.text)
-            elif hasattr(content, "data"):
-                content_data = BlobResourceContents(
-                    type="blob",
-                    data=content.data,
-                    mimeType=content.mimeType,
-                )
-            else:
-                # Fallback to string representation
-                content_data = TextContent(type="text", text=str(content))
-        else:
-            # No content in response
-            content_data = ""
-
-        return CreateMessageResult(
-            role=response.role, content=content_data, model="claude-sonnet-4-0"
+            **to_anthropic_request(params, model="claude-sonnet-4-0")
         )
+        return to_create_message_result(response)
 
     async def _handle_roots(
         self,
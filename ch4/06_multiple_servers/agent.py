@@ -2,29 +2,92 @@ import asyncio
 import json
 import logging
 import os
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, TypeVar
 
 from anthropic import Anthropic
+from anthropic.types import Message
 from client import MCPClient
+from context_compactor import ContextCompactor, summarize_tool_calls
+from conversation_store import ConversationStore
 from dotenv import load_dotenv
 from internal_tool import InternalTool
 from mcp import StdioServerParameters
 from mcp.types import TextResourceContents
+from prompt_cache import CACHE_CONTROL, TokenUsage, with_cache_breakpoint
+from resource_prefetcher import ResourcePrefetcher
+from server_launcher import ServerLauncher
+from tool_pipeline import ToolPipeline
 
 load_dotenv()
 
-LLM_API_KEY = os.environ["LLM_API_KEY"]
-anthropic_client = Anthropic(api_key=LLM_API_KEY)
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Where the time of a turn goes; anything not in one of these is counted as
+# message building. Resource and prompt loading run at once, so they overlap.
+TURN_PHASES = (
+    "selection",
+    "resource_loading",
+    "prompt_loading",
+    "llm",
+    "tool_execution",
+)
+# The conversation that the REPL continues, when its history is persisted
+REPL_CONVERSATION_ID = "repl"
+
 
 class Agent:
-    def __init__(self, mcp_client: MCPClient, anthropic_client: Anthropic):
+    def __init__(
+        self,
+        mcp_client: MCPClient,
+        anthropic_client: Anthropic,
+        cache_prompts: bool = True,
+        stream_responses: bool = True,
+        context_compactor: ContextCompactor | None = None,
+        conversation_store: ConversationStore | None = None,
+        max_concurrent_fetches: int = 8,
+        prefetcher: ResourcePrefetcher | None = None,
+    ):
         self.mcp_client = mcp_client
         self.anthropic_client = anthropic_client
+        # Whether to stream LLM responses, starting each tool as soon as the
+        # LLM has finished writing its call
+        self.stream_responses = stream_responses
+        # Keeps long tool use loops from re-sending their whole history
+        self.context_compactor = context_compactor or ContextCompactor()
+        # Remembers earlier turns of a conversation, when answering with one
+        self.conversation_store = conversation_store
+        # How many resources and prompts a turn loads at once
+        self.max_concurrent_fetches = max_concurrent_fetches
+        # Reads likely resources while the selection LLM is still deciding
+        self.prefetcher = prefetcher or ResourcePrefetcher()
+        # Whether to mark the tools, system prompt and resources for caching
+        self.cache_prompts = cache_prompts
+        self.token_usage = TokenUsage()
         self.available_resources = {}
         self.available_prompts = {}
+        self.available_tools: list[dict[str, Any]] = []
+        # Seconds spent in each phase of the last turn, see TURN_PHASES
+        self.turn_timings: dict[str, float] = {}
+
+    @contextmanager
+    def _timed(self, timings: dict[str, float], phase: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[phase] += time.perf_counter() - started_at
+
+    async def _timed_call(
+        self, timings: dict[str, float], phase: str, awaitable: Awaitable[T]
+    ) -> T:
+        with self._timed(timings, phase):
+            return await awaitable
 
     async def _select_resources(self, user_query: str) -> list[str]:
         """Use LLM to intelligently select relevant resources."""
@@ -50,11 +113,13 @@ Example: ["math-constants"] or []
 """
 
         try:
-            response = self.anthropic_client.messages.create(
+            response = await asyncio.to_thread(
+                self.anthropic_client.messages.create,
                 max_tokens=200,
                 messages=[{"role": "user", "content": selection_prompt}],
                 model="claude-sonnet-4-0",
             )
+            self.token_usage.record(response.usage)
 
             response_text = response.content[0].text.strip()
             if "[" in response_text and "]" in response_text:
@@ -96,11 +161,13 @@ Example: [{{"name": "calculation-helper", "arguments": {{"operation": "addition"
 """
 
         try:
-            response = self.anthropic_client.messages.create(
+            response = await asyncio.to_thread(
+                self.anthropic_client.messages.create,
                 max_tokens=200,
                 messages=[{"role": "user", "content": selection_prompt}],
                 model="claude-sonnet-4-0",
             )
+            self.token_usage.record(response.usage)
 
             response_text = response.content[0].text.strip()
             if "[" in response_text and "]" in response_text:
@@ -119,82 +186,121 @@ Example: [{{"name": "calculation-helper", "arguments": {{"operation": "addition"
 
         return []
 
-    async def _load_selected_resources(
-        self, resource_names: list[str]
+    async def _load_resource(
+        self, resource_name: str, fetches: asyncio.Semaphore
     ) -> list[dict[str, Any]]:
-        """Load the specified resources."""
+        """Load one resource as content blocks."""
         context_messages = []
-
-        for resource_name in resource_names:
-            if resource_name in self.available_resources:
-                print(f"LLM selected resource: {resource_name}")
-                try:
-                    resource = self.available_resources[resource_name]
-                    resource_contents = await self.mcp_client.get_resource(
-                        uri=resource.uri
+        try:
+            resource = self.available_resources[resource_name]
+            async with fetches:
+                resource_contents = await self.mcp_client.get_resource(
+                    uri=resource.uri
+                )
+            for content in resource_contents:
+                if isinstance(content, TextResourceContents):
+                    context_messages.append(
+                        {
+                            "type": "text",
+                            "text": f"[Resource: {resource_name}]\n{content.text}",
+                        }
+                    )
+                elif content.mimeType in [
+                    "image/jpeg",
+                    "image/png",
+                    "image/gif",
+                    "image/webp",
+                ]:  # b64-encoded image
+                    context_messages.append(
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": content.mimeType,
+                                "data": content.blob,
+                            },
+                        }
                     )
-                    for content in resource_contents:
-                        if isinstance(content, TextResourceContents):
-                            context_messages.append(
-                                {
-                                    "type": "text",
-                                    "text": f"[Resource: {resource_name}]\n{content.text}",
-                                }
-                            )
-                        elif content.mimeType in [
-                            "image/jpeg",
-                            "image/png",
-                            "image/gif",
-                            "image/webp",
-                        ]:  # b64-encoded image
-                            context_messages.append(
-                                {
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": content.mimeType,
-                                        "data": content.blob,
-                                    },
-                                }
-                            )
-                        else:
-                            print(
-                                f"WARNING: Unable to process mimeType {resource_contents.mimeType} for resource {resource_name}"
-                            )
-                except Exception as e:
-                    print(f"Error loading resource {resource_name}: {e}")
+                else:
+                    print(
+                        f"WARNING: Unable to process mimeType {content.mimeType} "
+                        f"for resource {resource_name}"
+                    )
+        except Exception as e:
+            print(f"Error loading resource {resource_name}: {e}")
 
         return context_messages
 
-    async def _load_selected_prompts(self, prompts: list[dict[str, Any]]) -> str:
-        """Load the specified prompts as system instructions."""
-        system_instructions = []
-
-        for prompt in prompts:
-            if prompt["name"] in self.available_prompts:
-                print(f"Using prompt: {prompt['name']}")
-                try:
-                    prompt_content = await self.mcp_client.load_prompt(
-                        name=prompt["name"], arguments=prompt["arguments"]
-                    )
-
-                    # Extract the prompt text
-                    prompt_text = ""
-                    for message in prompt_content:
-                        if hasattr(message.content, "text"):
-                            prompt_text += message.content.text + "\n"
-                        elif isinstance(message.content, str):
-                            prompt_text += message.content + "\n"
+    async def _load_selected_resources(
+        self,
+        resource_names: list[str],
+        fetches: asyncio.Semaphore | None = None,
+        prefetches: dict[str, asyncio.Task[list[dict[str, Any]]]] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Load the specified resources concurrently, in the order given. At most
+        max_concurrent_fetches are read at a time, or as many as fetches allows
+        when it is shared with other loaders. Resources already being read in
+        prefetches are taken from there.
+        """
+        fetches = fetches or asyncio.Semaphore(self.max_concurrent_fetches)
+        prefetches = prefetches or {}
+        loads = []
+        for resource_name in resource_names:
+            if resource_name in self.available_resources:
+                print(f"LLM selected resource: {resource_name}")
+                loads.append(
+                    prefetches.get(resource_name)
+                    or self._load_resource(resource_name, fetches)
+                )
+        loaded = await asyncio.gather(*loads)
+        return [block for blocks in loaded for block in blocks]
+
+    async def _load_prompt(
+        self, prompt: dict[str, Any], fetches: asyncio.Semaphore
+    ) -> str | None:
+        """Load one prompt as a system instruction."""
+        print(f"Using prompt: {prompt['name']}")
+        try:
+            async with fetches:
+                prompt_content = await self.mcp_client.load_prompt(
+                    name=prompt["name"], arguments=prompt["arguments"]
+                )
 
-                    if prompt_text.strip():
-                        system_instructions.append(
-                            f"[Prompt: {prompt['name']}]\n{prompt_text.strip()}"
-                        )
+            # Extract the prompt text
+            prompt_text = ""
+            for message in prompt_content:
+                if hasattr(message.content, "text"):
+                    prompt_text += message.content.text + "\n"
+                elif isinstance(message.content, str):
+                    prompt_text += message.content + "\n"
 
-                except Exception as e:
-                    print(f"Error loading prompt {prompt['name']}: {e}")
+            if prompt_text.strip():
+                return f"[Prompt: {prompt['name']}]\n{prompt_text.strip()}"
 
-        return "\n\n".join(system_instructions)
+        except Exception as e:
+            print(f"Error loading prompt {prompt['name']}: {e}")
+
+        return None
+
+    async def _load_selected_prompts(
+        self, prompts: list[dict[str, Any]], fetches: asyncio.Semaphore | None = None
+    ) -> str:
+        """
+        Load the specified prompts concurrently as system instructions, bounded
+        like _load_selected_resources.
+        """
+        fetches = fetches or asyncio.Semaphore(self.max_concurrent_fetches)
+        system_instructions = await asyncio.gather(
+            *(
+                self._load_prompt(prompt, fetches)
+                for prompt in prompts
+                if prompt["name"] in self.available_prompts
+            )
+        )
+        return "\n\n".join(
+            instruction for instruction in system_instructions if instruction
+        )
 
     async def _refresh(self) -> None:
         available_resources = await self.mcp_client.get_available_resources()
@@ -206,18 +312,246 @@ Example: [{{"name": "calculation-helper", "arguments": {{"operation": "addition"
             prompt.name: prompt for prompt in available_prompts
         }
 
+    async def start(self) -> None:
+        """Load the tool catalog and the available resources and prompts."""
+        available_tools: list[
+            InternalTool
+        ] = await self.mcp_client.get_available_tools()
+        self.available_tools = [
+            tool.translate_to_anthropic() for tool in available_tools
+        ]
+        # The tools come first in every request and are the same for every
+        # turn, so they are cached first
+        if self.cache_prompts:
+            self.available_tools = with_cache_breakpoint(self.available_tools)
+        await self._refresh()
+
+    async def _stream_message(
+        self,
+        create_message_args: dict[str, Any],
+        on_text: Callable[[str], None] | None,
+        tools: ToolPipeline,
+    ) -> Message:
+        """
+        Stream an LLM response, passing text to on_text as it arrives and
+        starting each tool call in tools as soon as its input is complete,
+        while the rest of the response is still being generated.
+        """
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def stream_in_thread() -> Message:
+            try:
+                with self.anthropic_client.messages.stream(
+                    **create_message_args
+                ) as stream:
+                    for event in stream:
+                        if event.type == "text" or (
+                            event.type == "content_block_stop"
+                            and event.content_block.type == "tool_use"
+                        ):
+                            loop.call_soon_threadsafe(events.put_nowait, event)
+                    return stream.get_final_message()
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        response = asyncio.ensure_future(asyncio.to_thread(stream_in_thread))
+        try:
+            while (event := await events.get()) is not None:
+                if event.type == "text":
+                    if on_text is not None:
+                        on_text(event.text)
+                else:
+                    tools.start(event.content_block)
+            return await response
+        except BaseException:
+            tools.cancel()
+            raise
+        finally:
+            tools.response_finished()
+
+    async def answer(
+        self,
+        prompt: str,
+        turn_timings: dict[str, float] | None = None,
+        on_text: Callable[[str], None] | None = None,
+        conversation_id: str | None = None,
+    ) -> str:
+        """
+        Answer one user query, calling tools until the LLM gives a final text
+        response. How long each phase took is written to turn_timings, and kept in
+        self.turn_timings, along with loading_overlap: the seconds in which resources
+        and prompts were both loading, and tool_overlap: the seconds of tool
+        execution hidden behind streaming responses. When responses are streamed,
+        on_text is called with each piece of text as it arrives. With a conversation
+        store and a conversation_id, the turn follows the conversation's earlier
+        turns and is added to them.
+
+        Several queries can be answered at once: the LLM calls run in worker
+        threads, and a turn only shares the catalogs and MCP sessions.
+        """
+        timings = {} if turn_timings is None else turn_timings
+        timings.clear()
+        timings.update(dict.fromkeys(TURN_PHASES, 0.0))
+        self.turn_timings = timings
+        started_at = time.perf_counter()
+        tool_overlap = 0.0
+
+        # Start reading the resources queries select most often, and select
+        # relevant resources and prompts meanwhile
+        fetches = asyncio.Semaphore(self.max_concurrent_fetches)
+        prefetches = self.prefetcher.start(
+            self.available_resources,
+            lambda resource_name: self._load_resource(resource_name, fetches),
+        )
+        with self._timed(timings, "selection"):
+            selected_resource_names, selected_prompt_names = await asyncio.gather(
+                self._select_resources(prompt), self._select_prompts(prompt)
+            )
+        # Unselected prefetches stop here, before they hold up any loading
+        self.prefetcher.finish(selected_resource_names, prefetches)
+
+        # Load relevant resources and prompts, all at once, timing each
+        loading_started_at = time.perf_counter()
+        context_messages, system_instructions = await asyncio.gather(
+            self._timed_call(
+                timings,
+                "resource_loading",
+                self._load_selected_resources(
+                    selected_resource_names, fetches, prefetches
+                ),
+            ),
+            self._timed_call(
+                timings,
+                "prompt_loading",
+                self._load_selected_prompts(selected_prompt_names, fetches),
+            ),
+        )
+        loading_overlap = max(
+            timings["resource_loading"]
+            + timings["prompt_loading"]
+            - (time.perf_counter() - loading_started_at),
+            0.0,
+        )
+
+        history = []
+        attachments = context_messages
+        if self.conversation_store is not None and conversation_id is not None:
+            history, attached = self.conversation_store.history(conversation_id)
+            # Resources the conversation already holds are referred back to
+            attachments = self.conversation_store.refer_back(
+                context_messages, attached
+            )
+            # Earlier turns only change by growing, so they are cached too
+            if history and self.cache_prompts:
+                history[-1]["content"] = with_cache_breakpoint(
+                    history[-1]["content"]
+                )
+
+        # Build conversation with initial user message and any context
+        user_content = [{"type": "text", "text": prompt}]
+        if attachments:
+            # Every request of the tool use loop repeats the resources
+            if self.cache_prompts:
+                user_content.extend(with_cache_breakpoint(attachments))
+            else:
+                user_content.extend(attachments)
+
+        conversation_messages = [*history, {"role": "user", "content": user_content}]
+        tool_calls = []
+
+        # Tool use loop - continue until we get a final text response
+        while True:
+            self.context_compactor.compact(conversation_messages, len(history))
+            create_message_args = {
+                "max_tokens": 4096,
+                "messages": conversation_messages,
+                "model": "claude-sonnet-4-0",
+                "tools": self.available_tools,
+                "tool_choice": {"type": "auto"},
+            }
+
+            if system_instructions:
+                system_block = {"type": "text", "text": system_instructions}
+                if self.cache_prompts:
+                    system_block["cache_control"] = CACHE_CONTROL
+                create_message_args["system"] = [system_block]
+
+            tools = ToolPipeline(self.mcp_client)
+            with self._timed(timings, "llm"):
+                if self.stream_responses:
+                    current_response = await self._stream_message(
+                        create_message_args, on_text, tools
+                    )
+                else:
+                    current_response = await asyncio.to_thread(
+                        self.anthropic_client.messages.create, **create_message_args
+                    )
+            self.token_usage.record(current_response.usage)
+
+            # Add assistant message to conversation
+            conversation_messages.append(
+                {"role": "assistant", "content": current_response.content}
+            )
+
+            # Check if we need to use tools
+            if current_response.stop_reason == "tool_use":
+                # Extract tool use blocks
+                tool_use_blocks = [
+                    block
+                    for block in current_response.content
+                    if block.type == "tool_use"
+                ]
+
+                # Execute all tools at once and collect results. Streamed tool
+                # calls are already running, so only the time spent waiting for
+                # them after the response is counted.
+                with self._timed(timings, "tool_execution"):
+                    tool_results = await tools.results(tool_use_blocks)
+                tool_overlap += tools.overlap
+                tool_calls.extend(
+                    summarize_tool_calls(current_response.content, tool_results)
+                )
+
+                # Add tool results to conversation
+                conversation_messages.append(
+                    {"role": "user", "content": tool_results}
+                )
+
+                # Continue loop to get next LLM response
+                continue
+
+            # No tools needed, extract final text response. A response cut off
+            # by max_tokens may still have started tool calls.
+            tools.cancel()
+            text_blocks = [
+                content.text
+                for content in current_response.content
+                if hasattr(content, "text") and content.text.strip()
+            ]
+            timings["message_building"] = (
+                time.perf_counter()
+                - started_at
+                - sum(timings.values())
+                + loading_overlap
+            )
+            timings["loading_overlap"] = loading_overlap
+            timings["tool_overlap"] = tool_overlap
+            answer = (
+                text_blocks[0] if text_blocks else "[No text response available]"
+            )
+            if self.conversation_store is not None and conversation_id is not None:
+                self.conversation_store.record_turn(
+                    conversation_id, prompt, context_messages, tool_calls, answer
+                )
+            return answer
+
     async def run(self):
         try:
             print(
                 "Welcome to your AI Assistant. Type 'goodbye' to quit or 'refresh' to reload and redisplay available resources."
             )
-            available_tools: list[
-                InternalTool
-            ] = await self.mcp_client.get_available_tools()
-            available_tools: list[dict[str, str]] = [
-                tool.translate_to_anthropic() for tool in available_tools
-            ]
-            await self._refresh()
+            await self.start()
 
             print(
                 f"Loaded {len(self.available_resources)} resources and {len(self.available_prompts)} prompts"
@@ -234,100 +568,28 @@ Example: [{{"name": "calculation-helper", "arguments": {{"operation": "addition"
                     await self._refresh()
                     continue
 
-                # Select relevant resources and prompts
-                selected_resource_names = await self._select_resources(prompt)
-                selected_prompt_names = await self._select_prompts(prompt)
-
-                # Load relevant resources and prompts
-                context_messages = await self._load_selected_resources(
-                    selected_resource_names
-                )
-                system_instructions = await self._load_selected_prompts(
-                    selected_prompt_names
-                )
-
-                # Build conversation with initial user message and any context
-                user_content = [{"type": "text", "text": prompt}]
-                if context_messages:
-                    user_content.extend(context_messages)
-
-                conversation_messages = [{"role": "user", "content": user_content}]
-
-                # Tool use loop - continue until we get a final text response
-                while True:
-                    create_message_args = {
-                        "max_tokens": 4096,
-                        "messages": conversation_messages,
-                        "model": "claude-sonnet-4-0",
-                        "tools": available_tools,
-                        "tool_choice": {"type": "auto"},
-                    }
-
-                    if system_instructions:
-                        create_message_args["system"] = system_instructions
-
-                    current_response = self.anthropic_client.messages.create(
-                        **create_message_args
-                    )
-
-                    # Add assistant message to conversation
-                    conversation_messages.append(
-                        {"role": "assistant", "content": current_response.content}
+                if not self.stream_responses:
+                    answer = await self.answer(
+                        prompt, conversation_id=REPL_CONVERSATION_ID
                     )
-
-                    # Check if we need to use tools
-                    if current_response.stop_reason == "tool_use":
-                        # Extract tool use blocks
-                        tool_use_blocks = [
-                            block
-                            for block in current_response.content
-                            if block.type == "tool_use"
-                        ]
-
-                        # Execute all tools and collect results
-                        tool_results = []
-                        for tool_use in tool_use_blocks:
-                            print(f"Using tool: {tool_use.name}")
-                            tool_result = await self.mcp_client.use_tool(
-                                tool_name=tool_use.name, arguments=tool_use.input
-                            )
-                            tool_results.append(
-                                {
-                                    "type": "tool_result",
-                                    "tool_use_id": tool_use.id,
-                                    "content": "\n".join(tool_result),
-                                }
-                            )
-
-                        # Add tool results to conversation
-                        conversation_messages.append(
-                            {"role": "user", "content": tool_results}
-                        )
-
-                        # Continue loop to get next LLM response
-                        continue
-
-                    else:
-                        # No tools needed, extract final text response
-                        text_blocks = [
-                            content.text
-                            for content in current_response.content
-                            if hasattr(content, "text") and content.text.strip()
-                        ]
-
-                        if text_blocks:
-                            print(f"Assistant: {text_blocks[0]}")
-                        else:
-                            print("Assistant: [No text response available]")
-
-                        # Exit the tool use loop
-                        break
+                    print(f"Assistant: {answer}")
+                    continue
+                print("Assistant: ", end="", flush=True)
+                await self.answer(
+                    prompt,
+                    on_text=lambda text: print(text, end="", flush=True),
+                    conversation_id=REPL_CONVERSATION_ID,
+                )
+                print()
         finally:
+            logger.info(f"Token usage: {self.token_usage.summary()}")
+            logger.info(f"Resource prefetch: {self.prefetcher.summary()}")
             await self.mcp_client.disconnect()
 
 
 async def main():
     """Main async function to run the agent with proper connection management."""
+    anthropic_client = Anthropic(api_key=os.environ["LLM_API_KEY"])
     calculator_server_parameters = StdioServerParameters(
         command="uv",
         args=[
@@ -343,9 +605,17 @@ async def main():
         file_roots=[
             f"file:///{str(Path(__file__).parent.resolve())}",
         ],
+        launcher=ServerLauncher(),
     )
     await mcp_client.connect(calculator_server_parameters)
-    agent = Agent(mcp_client, anthropic_client)
+    # Set CONVERSATION_DIR to carry the conversation over to the next run
+    conversation_dir = os.environ.get("CONVERSATION_DIR")
+    conversation_store = ConversationStore(
+        Path(conversation_dir) if conversation_dir else None
+    )
+    agent = Agent(
+        mcp_client, anthropic_client, conversation_store=conversation_store
+    )
     await agent.run()
 
 
@@ -0,0 +1,163 @@
+"""
+Measure how much time the agent itself adds to each turn, with the scripted
+fake LLM standing in for Anthropic and the calculator server over stdio.
+
+    python agent_benchmark.py --repeat 20 --output agent_benchmark.json
+    python agent_benchmark.py --conversations 32 --llm-latency 0.2
+
+Every query in the script is answered --repeat times in each of --conversations
+conversations, which all run at once in one agent service. The time of each turn is
+split into selection, resource loading, prompt loading, the (fake) LLM calls, tool
+execution and message building, which is everything else. Resources and prompts load
+at once, so their phases overlap. --llm-latency makes every LLM request take that
+long, to see how throughput scales with the number of conversations.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from agent import TURN_PHASES
+from agent_service import AgentService, reserve_llm_threads
+from fake_llm import ScriptedLLM
+from headless import connect_agent, run_queries
+
+DEFAULT_SCRIPT = Path(__file__).parent / "benchmark_script.json"
+PHASES = (*TURN_PHASES, "message_building")
+
+
+async def converse(
+    service: AgentService, conversation_id: str, queries: list[str], repeat: int
+) -> list[dict]:
+    turns = []
+    for _ in range(repeat):
+        for query in queries:
+            timings = {}
+            await service.ask(conversation_id, query, timings)
+            turns.append({"query": query, "timings": timings})
+    return turns
+
+
+def summarize(durations: list[float]) -> dict[str, float]:
+    return {
+        "mean_ms": statistics.fmean(durations) * 1000,
+        "p50_ms": statistics.median(durations) * 1000,
+        "max_ms": max(durations) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--script", type=Path, default=DEFAULT_SCRIPT)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--conversations", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    llm_client = ScriptedLLM.from_file(args.script)
+    queries = list(llm_client.turns)
+    reserve_llm_threads(args.conversations)
+
+    # Silence the agent's and client's console output, which is not the work
+    # being measured
+    with redirect_stdout(io.StringIO()):
+        agent = await connect_agent(llm_client)
+        try:
+            for _ in range(args.warmup):
+                await run_queries(agent, queries)
+            # Only the measured turns wait for the LLM
+            llm_client.latency = args.llm_latency
+            service = AgentService(agent, max_concurrent_turns=args.conversations)
+            started_at = time.perf_counter()
+            conversations = await asyncio.gather(
+                *(
+                    converse(service, str(index), queries, args.repeat)
+                    for index in range(args.conversations)
+                )
+            )
+            elapsed = time.perf_counter() - started_at
+            turns = [turn for conversation in conversations for turn in conversation]
+        finally:
+            await agent.mcp_client.disconnect()
+
+    phases = {
+        phase: summarize([turn["timings"][phase] for turn in turns])
+        for phase in PHASES
+    }
+    phases["total"] = summarize(
+        [
+            sum(turn["timings"][phase] for phase in PHASES)
+            - turn["timings"]["loading_overlap"]
+            for turn in turns
+        ]
+    )
+    # Resource and prompt loading that ran at the same time, counted in both
+    loading_overlap = summarize(
+        [turn["timings"]["loading_overlap"] for turn in turns]
+    )
+    # Tool execution that overlapped the LLM streaming its response, already
+    # counted in the llm phase
+    tool_overlap = summarize([turn["timings"]["tool_overlap"] for turn in turns])
+    by_query = {
+        query: {
+            phase: statistics.fmean(
+                turn["timings"][phase] for turn in turns if turn["query"] == query
+            )
+            * 1000
+            for phase in PHASES
+        }
+        for query in queries
+    }
+
+    print(
+        f"{len(turns)} turns in {args.conversations} conversations, "
+        f"{llm_client.requests} LLM requests, {len(turns) / elapsed:.1f} turns/s"
+    )
+    print(f"{'phase':20}{'mean_ms':>10}{'p50_ms':>10}{'max_ms':>10}{'share':>8}")
+    total_mean = phases["total"]["mean_ms"]
+    for phase, summary in phases.items():
+        print(
+            f"{phase:20}{summary['mean_ms']:10.3f}{summary['p50_ms']:10.3f}"
+            f"{summary['max_ms']:10.3f}{summary['mean_ms'] / total_mean:8.1%}"
+        )
+    print(f"Resource prefetch: {agent.prefetcher.summary()}")
+    for name, overlap in (
+        ("loading_overlap", loading_overlap),
+        ("tool_overlap", tool_overlap),
+    ):
+        print(
+            f"{name:20}{overlap['mean_ms']:10.3f}"
+            f"{overlap['p50_ms']:10.3f}{overlap['max_ms']:10.3f}"
+        )
+
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "turns": len(turns),
+                    "conversations": args.conversations,
+                    "llm_latency": args.llm_latency,
+                    "turns_per_s": len(turns) / elapsed,
+                    "llm_requests": llm_client.requests,
+                    "phases": phases,
+                    "loading_overlap": loading_overlap,
+                    "tool_overlap": tool_overlap,
+                    "resource_prefetch": agent.prefetcher.summary(),
+                    "by_query_mean_ms": by_query,
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,253 @@
+"""
+Serve many conversations at once from one agent process. Requests are JSON
+lines read from stdin, or from connections to a local socket:
+
+    {"id": 1, "conversation_id": "alice", "query": "What is 2 + 3?"}
+
+Each answer is written back as a JSON line as soon as it is ready, so answers
+to different conversations can come back in any order:
+
+    {"id": 1, "conversation_id": "alice", "answer": "...", "timings": {...}}
+
+    python agent_service.py < requests.jsonl
+    python agent_service.py --socket /tmp/agent.sock
+    python agent_service.py --port 8765 --script benchmark_script.json
+
+With --script the scripted fake LLM answers instead of Anthropic, taking
+--llm-latency seconds per request.
+
+When requests come from stdin, the agent cannot also read the user's answers
+to elicitation from it, so servers are told it does not support elicitation.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from collections.abc import AsyncIterator, Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from agent import Agent
+from anthropic import Anthropic
+from conversation_store import ConversationStore
+from fake_llm import ScriptedLLM
+from headless import connect_agent
+
+logger = logging.getLogger(__name__)
+
+# LLM calls a turn can have in flight at once: resource and prompt selection
+LLM_CALLS_PER_TURN = 2
+
+
+class _Conversation:
+    def __init__(self, max_turns: int) -> None:
+        self.turns = asyncio.Semaphore(max_turns)
+        # Queries asked and not yet answered
+        self.pending = 0
+
+
+class AgentService:
+    """
+    Answers queries from many conversations at once with one agent, so they all
+    share its MCP sessions and its tool, resource and prompt catalogs.
+
+    At most max_concurrent_turns queries are answered at a time, and at most
+    max_turns_per_conversation of them from the same conversation. With the
+    default of one, a conversation's queries are answered one at a time in the
+    order they were asked, and a busy conversation does not hold a turn while
+    it waits. When the agent has a conversation store, each query follows the
+    earlier turns of its conversation; queries answered at the same time in
+    one conversation do not see each other.
+    """
+
+    def __init__(
+        self,
+        agent: Agent,
+        max_concurrent_turns: int = 64,
+        max_turns_per_conversation: int = 1,
+    ) -> None:
+        self.agent = agent
+        self.max_turns_per_conversation = max_turns_per_conversation
+        self._turns = asyncio.Semaphore(max_concurrent_turns)
+        self._conversations: dict[str, _Conversation] = {}
+        self.answered = 0
+        self.failed = 0
+
+    async def ask(
+        self,
+        conversation_id: str | None,
+        query: str,
+        turn_timings: dict[str, float] | None = None,
+    ) -> str:
+        """
+        Answer a query in a conversation, or on its own without any history
+        when conversation_id is None. See Agent.answer.
+        """
+        key = str(uuid4()) if conversation_id is None else conversation_id
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            conversation = _Conversation(self.max_turns_per_conversation)
+            self._conversations[key] = conversation
+        conversation.pending += 1
+        try:
+            async with conversation.turns, self._turns:
+                answer = await self.agent.answer(
+                    query, turn_timings, conversation_id=conversation_id
+                )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            conversation.pending -= 1
+            if not conversation.pending:
+                del self._conversations[key]
+        self.answered += 1
+        return answer
+
+    async def serve_lines(
+        self,
+        lines: AsyncIterator[bytes],
+        write: Callable[[dict[str, Any]], Awaitable[None]],
+    ) -> None:
+        """
+        Answer every JSON line request from lines, passing each response to
+        write as soon as it is ready. Returns once lines ends and every request
+        read from it has been answered.
+        """
+        tasks = set()
+        async for line in lines:
+            if not line.strip():
+                continue
+            task = asyncio.create_task(self._answer_line(line, write))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _answer_line(
+        self, line: bytes, write: Callable[[dict[str, Any]], Awaitable[None]]
+    ) -> None:
+        try:
+            request = json.loads(line)
+            query = request["query"]
+        except (ValueError, TypeError, KeyError) as error:
+            await write({"error": f"Invalid request: {error!r}"})
+            return
+        # A request without a conversation is answered on its own
+        conversation_id = request.get("conversation_id")
+        if conversation_id is not None:
+            conversation_id = str(conversation_id)
+        response = {"id": request.get("id"), "conversation_id": conversation_id}
+        timings = {}
+        try:
+            response["answer"] = await self.ask(conversation_id, query, timings)
+            response["timings"] = timings
+        except Exception as error:
+            logger.exception(f"Failed to answer {query!r}")
+            response["error"] = str(error)
+        await write(response)
+
+    async def serve_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answer the JSON line requests sent over one socket connection."""
+
+        async def write(response: dict[str, Any]) -> None:
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            await self.serve_lines(reader, write)
+        except ConnectionError as error:
+            logger.warning(f"Connection closed: {error}")
+        finally:
+            writer.close()
+
+
+def reserve_llm_threads(max_concurrent_turns: int) -> None:
+    """
+    Give the running loop's default executor enough threads for the blocking
+    LLM calls of max_concurrent_turns turns. The default pool has at most 32
+    threads, and far fewer on small machines, which would cap how many turns
+    make progress at once however many are allowed.
+    """
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max_concurrent_turns * LLM_CALLS_PER_TURN + 4)
+    )
+
+
+async def _read_stdin() -> AsyncIterator[bytes]:
+    # Read in a thread, since stdin may be a regular file that the event loop
+    # cannot watch
+    while line := await asyncio.to_thread(sys.stdin.buffer.readline):
+        yield line
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    listen = parser.add_mutually_exclusive_group()
+    listen.add_argument("--socket", type=Path, help="Listen on a Unix socket")
+    listen.add_argument("--port", type=int, help="Listen on a TCP port on 127.0.0.1")
+    parser.add_argument("--max-concurrent-turns", type=int, default=64)
+    parser.add_argument("--max-turns-per-conversation", type=int, default=1)
+    parser.add_argument(
+        "--conversation-dir", type=Path, help="Keep conversation history on disk"
+    )
+    parser.add_argument("--script", type=Path, help="Answer with the fake LLM")
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.script:
+        llm_client = ScriptedLLM.from_file(args.script, latency=args.llm_latency)
+    else:
+        llm_client = Anthropic(api_key=os.environ["LLM_API_KEY"])
+
+    reserve_llm_threads(args.max_concurrent_turns)
+    stdout = sys.stdout
+    # The agent reports tool use with print(), which must not mix with the
+    # JSON lines on stdout
+    with redirect_stdout(sys.stderr):
+        agent = await connect_agent(
+            llm_client,
+            ConversationStore(args.conversation_dir),
+            # Requests are read from stdin unless there is a socket to listen on
+            allow_elicitation=bool(args.socket or args.port),
+        )
+        service = AgentService(
+            agent, args.max_concurrent_turns, args.max_turns_per_conversation
+        )
+        try:
+            if args.socket:
+                server = await asyncio.start_unix_server(
+                    service.serve_connection, path=args.socket
+                )
+            elif args.port:
+                server = await asyncio.start_server(
+                    service.serve_connection, host="127.0.0.1", port=args.port
+                )
+            else:
+
+                async def write(response: dict[str, Any]) -> None:
+                    stdout.write(json.dumps(response) + "\n")
+                    stdout.flush()
+
+                await service.serve_lines(_read_stdin(), write)
+                return
+
+            print(f"Listening on {args.socket or f'127.0.0.1:{args.port}'}")
+            async with server:
+                await server.serve_forever()
+        finally:
+            await agent.mcp_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,29 @@
+import asyncio
 import json
 import logging
+import sys
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import AsyncExitStack, contextmanager, suppress
+from functools import partial
+from pathlib import Path
 from typing import Any
 
 from anthropic import Anthropic
+from anthropic.types import Message
+from concurrent_session import ConcurrentClientSession
+from in_flight import CancellationStats, InFlightRequest
 from internal_tool import InternalTool
 from mcp import ClientSession
-from mcp.client.session_group import ClientSessionGroup, ServerParameters
+from mcp.client.session_group import (
+    ServerParameters,
+    SseServerParameters,
+    StdioServerParameters,
+)
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
 from mcp.shared.context import RequestContext
+from mcp.shared.exceptions import McpError
 from mcp.types import (
     BlobResourceContents,
     CreateMessageRequestParams,
@@ -14,6 +31,7 @@ from mcp.types import (
     ElicitRequestParams,
     ElicitResult,
     ErrorData,
+    InitializeResult,
     ListRootsResult,
     LoggingMessageNotificationParams,
     Prompt,
@@ -21,24 +39,104 @@ from mcp.types import (
     Resource,
     ResourceTemplate,
     Root,
-    TextContent,
     TextResourceContents,
 )
+from pydantic import AnyUrl
+from sampling_cache import SamplingCache
+from sampling_router import SamplingRouter
+from server_launcher import ServerLauncher
+from server_pool import StdioServerPool, stdio_transport
+from session_router import SessionRouter
+
+# The sampling adapter is shared by the chapter's clients, so it lives next to
+# the calculator server
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from sampling_adapter import to_anthropic_request, to_create_message_result
 
 logger = logging.getLogger(__name__)
 
 
+class ConnectResult:
+    """The outcome of connecting to one server with MCPClient.connect_all."""
+
+    def __init__(
+        self,
+        server_parameters: ServerParameters,
+        latency: float,
+        session: ClientSession | None = None,
+        error: Exception | None = None,
+    ) -> None:
+        self.server_parameters = server_parameters
+        self.latency = latency
+        self.session = session
+        self.error = error
+
+    @property
+    def name(self) -> str:
+        if isinstance(self.server_parameters, StdioServerParameters):
+            return " ".join(
+                [self.server_parameters.command, *self.server_parameters.args]
+            )
+        return self.server_parameters.url
+
+
 class MCPClient:
     def __init__(
         self,
         name: str,
         llm_client: Anthropic,
         file_roots: list[str] = None,
+        sampling_router: SamplingRouter | None = None,
+        session_router: SessionRouter | None = None,
+        launcher: ServerLauncher | None = None,
+        allow_elicitation: bool = True,
     ) -> None:
         self.name = name
+        # Without elicitation, servers are told the client cannot ask the user
+        # for input, for clients with no terminal of their own to ask at
+        self.allow_elicitation = allow_elicitation
         self.file_roots = file_roots
         self._llm_client = llm_client
-        self._session_group = ClientSessionGroup()
+        self._sampling_router = sampling_router or SamplingRouter()
+        # Routes each tool, resource and prompt to the servers that provide it
+        self._session_router = session_router or SessionRouter()
+        # Resolves `uv run` server commands so stdio servers start without uv
+        self._launcher = launcher
+        # How to close each session's transport, in the task that opened it
+        self._session_closers: dict[
+            ClientSession, Callable[[], Awaitable[None]]
+        ] = {}
+        self.cancellation_stats = CancellationStats()
+        self._sampling_cache = SamplingCache()
+        # Sessions whose sampling requests may be answered from the cache
+        self._sampling_cache_sessions: set[ClientSession] = set()
+
+    @contextmanager
+    def _track_request(
+        self,
+        context: RequestContext[ClientSession, Any],
+        kind: str,
+        max_tokens: int = 0,
+    ) -> Iterator[InFlightRequest]:
+        """
+        Follow a server-initiated request for as long as it runs. When the server
+        cancels it, the SDK cancels the request's task; the handler is then
+        responsible for stopping its worker thread and recording the work saved.
+        """
+        request = InFlightRequest(
+            session=context.session,
+            request_id=context.request_id,
+            kind=kind,
+            max_tokens=max_tokens,
+        )
+        try:
+            yield request
+        except asyncio.CancelledError:
+            logger.info(
+                f"{kind.capitalize()} request {request.request_id} cancelled after "
+                f"{request.elapsed():.2f}s"
+            )
+            raise
 
     async def _handle_logs(self, params: LoggingMessageNotificationParams) -> None:
         """
@@ -55,25 +153,66 @@ class MCPClient:
     ) -> CreateMessageResult | ErrorData:
         """
         Sampling handler that passes the server's prompt to the LLM client, implementing
-        the SamplingFnT protocol, which is why the unused context parameter is included.
+        the SamplingFnT protocol. The context gives the request ID that the request
+        is tracked and cancelled by.
         """
-        messages = []
-        for message in params.messages:
-            if isinstance(message.content, TextContent):
-                messages.append(
-                    {"role": message.role, "content": message.content.text}
-                )
-            else:
-                # Handle other content types if needed
-                messages.append(
-                    {"role": message.role, "content": str(message.content)}
+        # Route to the configured model that best fits the server's preferences
+        model = self._sampling_router.select(params.modelPreferences)
+        logger.debug(f"Sampling request {context.request_id} routed to {model.name}")
+        request_kwargs = to_anthropic_request(params, model=model.name)
+        llm_client = model.llm_client or self._llm_client
+
+        with self._track_request(
+            context, "sampling", max_tokens=params.maxTokens
+        ) as request:
+            if context.session in self._sampling_cache_sessions:
+                return await self._sampling_cache.get_or_create(
+                    SamplingCache.key(params),
+                    lambda: self._sample(llm_client, request_kwargs, request),
                 )
+            return await self._sample(llm_client, request_kwargs, request)
 
-        response = self._llm_client.messages.create(
-            max_tokens=params.maxTokens,
-            messages=messages,
-            model="claude-sonnet-4-0",
-        )
+    async def _sample(
+        self,
+        llm_client: Anthropic,
+        request_kwargs: dict[str, Any],
+        request: InFlightRequest,
+    ) -> CreateMessageResult:
+        """
+        Run the LLM call for a sampling request.
+        """
+        # The blocking LLM call runs in a worker thread so the event loop stays
+        # free to read notifications/cancelled for this request. Cancellation
+        # sets the abort flag, which closes the LLM response stream.
+        try:
+            response = await asyncio.to_thread(
+                self._stream_sampling_response, llm_client, request_kwargs, request
+            )
+        except asyncio.CancelledError:
+            request.abort.set()
+            self.cancellation_stats.record(request)
+            raise
+
+        return to_create_message_result(response)
+
+    def _stream_sampling_response(
+        self,
+        llm_client: Anthropic,
+        request_kwargs: dict[str, Any],
+        request: InFlightRequest,
+    ) -> Message:
+        """
+        Stream a completion from the LLM, stopping early when the request is
+        aborted. Leaving the stream context closes the underlying HTTP response, so
+        no further tokens are generated for an abandoned request.
+        """
+        with llm_client.messages.stream(**request_kwargs) as stream:
+            for event in stream:
+                if request.abort.is_set():
+                    break
+                if event.type == "text":
+                    request.generated_chars += len(event.text)
+            return stream.current_message_snapshot
 
     async def _handle_roots(
         self,
@@ -83,13 +222,11 @@ class MCPClient:
         Roots handler that returns the file roots, implementing the RootsFnT protocol.
         """
         roots_result = []
-        for root in self.file_roots:
+        for root in self.file_roots or []:
             if not root.startswith("file:///"):
                 logger.warning(f"Root {root} does not start with file:///, ignoring")
             else:
                 roots_result.append(Root(uri=root))
-        if roots_result is None:
-            return ErrorData(code=-32602, message="No valid file roots provided")
         return ListRootsResult(roots=roots_result)
 
     def _collect_form_data(self, schema: dict[str, Any]) -> dict[str, Any] | None:
@@ -194,6 +331,28 @@ class MCPClient:
         their accept/decline response, and collects form data when accepted,
         implementing the ElicitFnT protocol.
         """
+        # input() blocks, so the prompt runs in a worker thread. If the server
+        # cancels the request, the handler returns straight away and the thread
+        # drops whatever the user types next.
+        with self._track_request(context, "elicitation") as request:
+            try:
+                return await asyncio.to_thread(
+                    self._prompt_for_elicitation, params, request
+                )
+            except asyncio.CancelledError:
+                request.abort.set()
+                self.cancellation_stats.record(request)
+                print(
+                    "\nThe server cancelled this request. Press Enter to continue."
+                )
+                raise
+
+    def _prompt_for_elicitation(
+        self, params: ElicitRequestParams, request: InFlightRequest
+    ) -> ElicitResult:
+        """
+        Display the elicitation request and collect the user's response.
+        """
         # Get the server name from the client instance
         requesting_server = self.name
 
@@ -212,6 +371,9 @@ class MCPClient:
                 .strip()
             )
 
+            if request.abort.is_set():
+                return ElicitResult(action="cancel")
+
             if user_response in ["y", "yes", "accept"]:
                 print("Request accepted")
                 # Collect form data based on the schema
@@ -233,26 +395,242 @@ class MCPClient:
                     "Invalid response. Please enter 'y' (accept), 'n' (decline), or 'c' (cancel)."
                 )
 
-    async def connect(self, server_parameters: ServerParameters) -> None:
+    async def connect(
+        self, server_parameters: ServerParameters, cache_sampling: bool = False
+    ) -> ClientSession:
         """
-        Connect to the server set in the constructor.
+        Connect to a server and add its tools, resources, and prompts to the group.
+        With cache_sampling, identical sampling requests from this server are
+        answered from the sampling cache and concurrent duplicates share one LLM
+        call; leave it off for servers that expect a fresh sample every time.
+        """
+        session_stack = AsyncExitStack()
+        try:
+            session = await self._open_session(server_parameters, session_stack)
+        except Exception:
+            await session_stack.aclose()
+            raise
+        self._session_closers[session] = session_stack.aclose
+        if cache_sampling:
+            self._sampling_cache_sessions.add(session)
+        return session
+
+    async def connect_all(
+        self,
+        server_parameters_list: list[ServerParameters],
+        max_concurrency: int = 8,
+        connect_timeout: float | None = 30.0,
+        cache_sampling: bool = False,
+    ) -> list[ConnectResult]:
         """
-        connected_server = await self._session_group.connect_to_server(
-            server_params=server_parameters,
+        Connect to several servers concurrently, at most max_concurrency at a time.
+        A server that fails or takes longer than connect_timeout to connect is
+        reported in its result instead of stopping the others from connecting.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        results = await asyncio.gather(
+            *(
+                self._connect_in_task(
+                    server_parameters, semaphore, connect_timeout, cache_sampling
+                )
+                for server_parameters in server_parameters_list
+            )
+        )
+        for result in results:
+            if result.error is None:
+                logger.info(f"Connected to {result.name} in {result.latency:.2f}s")
+            else:
+                logger.warning(
+                    f"Could not connect to {result.name} after "
+                    f"{result.latency:.2f}s: {result.error!r}"
+                )
+        return results
+
+    async def _connect_in_task(
+        self,
+        server_parameters: ServerParameters,
+        semaphore: asyncio.Semaphore,
+        connect_timeout: float | None,
+        cache_sampling: bool,
+    ) -> ConnectResult:
+        """
+        Connect to a server from a task of its own. The transport and session are
+        entered in that task, so they must also be exited there; disconnecting
+        signals the task to close them rather than closing them directly.
+        """
+        async with semaphore:
+            started_at = time.perf_counter()
+            ready = asyncio.get_running_loop().create_future()
+            close = asyncio.Event()
+            owner = asyncio.create_task(
+                self._hold_session(server_parameters, ready, close)
+            )
+            try:
+                async with asyncio.timeout(connect_timeout):
+                    session = await asyncio.shield(ready)
+            except BaseException as error:
+                latency = time.perf_counter() - started_at
+                # Whether the connection failed, ran out of time or connect_all
+                # was cancelled, the owner task closes whatever it has opened
+                owner.cancel()
+                with suppress(asyncio.CancelledError):
+                    await owner
+                if ready.done() and not ready.cancelled() and not ready.exception():
+                    self._session_router.remove(ready.result())
+                if not isinstance(error, Exception):
+                    raise
+                return ConnectResult(server_parameters, latency=latency, error=error)
+
+        async def close_session() -> None:
+            close.set()
+            await owner
+
+        self._session_closers[session] = close_session
+        if cache_sampling:
+            self._sampling_cache_sessions.add(session)
+        return ConnectResult(
+            server_parameters,
+            latency=time.perf_counter() - started_at,
+            session=session,
+        )
+
+    async def _hold_session(
+        self,
+        server_parameters: ServerParameters,
+        ready: asyncio.Future[ClientSession],
+        close: asyncio.Event,
+    ) -> None:
+        """
+        Open a session, hand it over through ready, and keep it open until close is
+        set.
+        """
+        async with AsyncExitStack() as session_stack:
+            try:
+                session = await self._open_session(server_parameters, session_stack)
+            except Exception as error:
+                ready.set_exception(error)
+                return
+            ready.set_result(session)
+            await close.wait()
+
+    async def _open_session(
+        self, server_parameters: ServerParameters, session_stack: AsyncExitStack
+    ) -> ClientSession:
+        """
+        Start the transport and session on session_stack, initialize the session
+        and index the tools, resources, and prompts it provides.
+        """
+        if isinstance(server_parameters, StdioServerParameters):
+            if self._launcher is not None:
+                server_parameters = await self._launcher.resolve(server_parameters)
+            read, write = await session_stack.enter_async_context(
+                stdio_transport(server_parameters)
+            )
+        elif isinstance(server_parameters, SseServerParameters):
+            read, write = await session_stack.enter_async_context(
+                sse_client(
+                    url=server_parameters.url,
+                    headers=server_parameters.headers,
+                    timeout=server_parameters.timeout,
+                    sse_read_timeout=server_parameters.sse_read_timeout,
+                )
+            )
+        else:
+            read, write, _ = await session_stack.enter_async_context(
+                streamablehttp_client(
+                    url=server_parameters.url,
+                    headers=server_parameters.headers,
+                    timeout=server_parameters.timeout,
+                    sse_read_timeout=server_parameters.sse_read_timeout,
+                    terminate_on_close=server_parameters.terminate_on_close,
+                )
+            )
+
+        # Callbacks are passed in up front so the client capabilities sent
+        # during initialization advertise sampling, roots and elicitation
+        session = await session_stack.enter_async_context(
+            ConcurrentClientSession(
+                read_stream=read, write_stream=write, **self._session_callbacks()
+            )
         )
-        connected_server._logging_callback = self._handle_logs
-        connected_server._sampling_callback = self._handle_sampling
-        connected_server._list_roots_callback = self._handle_roots
-        connected_server._elicitation_callback = self._handle_elicitation
+        initialize_result = await session.initialize()
+        await self._index_session(session, initialize_result)
+        return session
+
+    def _session_callbacks(self) -> dict[str, Any]:
+        callbacks = {
+            "logging_callback": self._handle_logs,
+            "sampling_callback": self._handle_sampling,
+            "list_roots_callback": self._handle_roots,
+        }
+        if self.allow_elicitation:
+            callbacks["elicitation_callback"] = self._handle_elicitation
+        return callbacks
+
+    async def _index_session(
+        self, session: ClientSession, initialize_result: InitializeResult
+    ) -> None:
+        """Add the tools, resources, and prompts a session provides to the router."""
+        # Only ask for the components the server says it supports
+        capabilities = initialize_result.capabilities
+        tools, resources, prompts = [], [], []
+        if capabilities.tools:
+            tools = (await session.list_tools()).tools
+        if capabilities.resources:
+            resources = (await session.list_resources()).resources
+        if capabilities.prompts:
+            prompts = (await session.list_prompts()).prompts
+        self._session_router.add(
+            session,
+            name=initialize_result.serverInfo.name,
+            tools=tools,
+            resources=resources,
+            prompts=prompts,
+        )
+
+    async def connect_from_pool(
+        self, pool: StdioServerPool, cache_sampling: bool = False
+    ) -> ClientSession:
+        """
+        Connect using an already running and initialized server from pool, which
+        skips spawning the process and the initialize handshake. Disconnecting
+        hands the server back to the pool. The pool's servers advertise
+        elicitation or not when they start, so it has to match allow_elicitation.
+        """
+        if pool.allow_elicitation != self.allow_elicitation:
+            raise ValueError(
+                f"Pool has allow_elicitation={pool.allow_elicitation} but this "
+                f"client has allow_elicitation={self.allow_elicitation}"
+            )
+        server = await pool.acquire()
+        server.attach(self._session_callbacks())
+        try:
+            # The server may have cached another client's roots
+            await server.session.send_roots_list_changed()
+            await self._index_session(server.session, server.initialize_result)
+        except Exception:
+            self._session_router.remove(server.session)
+            await pool.release(server)
+            raise
+        self._session_closers[server.session] = partial(pool.release, server)
+        if cache_sampling:
+            self._sampling_cache_sessions.add(server.session)
+        return server.session
 
     async def use_tool(
-        self, tool_name: str, arguments: dict[str, Any] | None = None
+        self,
+        tool_name: str,
+        arguments: dict[str, Any] | None = None,
+        timeout: float | None = None,
     ) -> list[str]:
-        if not self._session_group.sessions:
+        if not self._session_router.sessions:
             raise RuntimeError("Client not connected to a server")
 
-        tool_call_result = await self._session_group.call_tool(
-            name=tool_name, args=arguments
+        tool_call_result = await self._session_router.route(
+            "tool",
+            tool_name,
+            lambda session: session.call_tool(tool_name, arguments),
+            timeout=timeout,
         )
         logger.debug(f"Calling tool {tool_name} with arguments {arguments}")
 
@@ -274,11 +652,16 @@ class MCPClient:
         return results
 
     async def get_resource(
-        self, uri: str
+        self, uri: str | AnyUrl
     ) -> list[BlobResourceContents | TextResourceContents]:
-        if not self._session_group.sessions:
+        if not self._session_router.sessions:
             raise RuntimeError("Client not connected to a server")
-        resource_read_result = await self._session_group.read_resource(uri=uri)
+        resource_read_result = await self._session_router.route(
+            "resource",
+            str(uri),
+            lambda session: session.read_resource(AnyUrl(str(uri))),
+            retry_on_timeout=True,
+        )
 
         if not resource_read_result.contents:
             logger.warning(f"No content read for resource URI {uri}")
@@ -287,10 +670,13 @@ class MCPClient:
     async def load_prompt(
         self, name: str, arguments: dict[str, str]
     ) -> list[PromptMessage]:
-        if not self._session_group.sessions:
+        if not self._session_router.sessions:
             raise RuntimeError("Client not connected to a server")
-        prompt_load_result = await self._session_group.get_prompt(
-            name=name, arguments=arguments
+        prompt_load_result = await self._session_router.route(
+            "prompt",
+            name,
+            lambda session: session.get_prompt(name, arguments),
+            retry_on_timeout=True,
         )
 
         if not prompt_load_result.messages:
@@ -302,30 +688,35 @@ class MCPClient:
         return prompt_load_result.messages
 
     async def get_available_resources(self) -> list[Resource]:
-        if not self._session_group.sessions:
+        if not self._session_router.sessions:
             raise RuntimeError("Client not connected to a server")
 
-        resources_result = list(self._session_group.resources.values())
+        resources_result = list(self._session_router.resources.values())
         if not resources_result:
             logger.warning("No resources found on server")
         return resources_result
 
     async def get_available_resource_templates(self) -> list[ResourceTemplate]:
-        if not self._session_group.sessions:
+        if not self._session_router.sessions:
             raise RuntimeError("Client not connected to a server")
 
-        resource_templates_result = (
-            await self._session_group.list_resource_templates()
-        )
-        if not resource_templates_result.resources:
+        resource_templates_result = []
+        for session in self._session_router.sessions:
+            try:
+                resource_templates_result.extend(
+                    (await session.list_resource_templates()).resourceTemplates
+                )
+            except McpError as error:
+                logger.warning(f"Could not list resource templates: {error}")
+        if not resource_templates_result:
             logger.warning("No resource templates found on server")
-        return resource_templates_result.resources
+        return resource_templates_result
 
     async def get_available_tools(self) -> list[dict[str, Any]]:
-        if not self._session_group.sessions:
+        if not self._session_router.sessions:
             raise RuntimeError("Client not connected to a server")
 
-        if not self._session_group.tools:
+        if not self._session_router.tools:
             logger.warning("No tools found on server")
         available_tools = [
             InternalTool(
@@ -333,15 +724,15 @@ class MCPClient:
                 description=tool.description,
                 input_schema=tool.inputSchema,
             )
-            for tool in self._session_group.tools.values()
+            for tool in self._session_router.tools.values()
         ]
         return available_tools
 
     async def get_available_prompts(self) -> list[Prompt]:
-        if not self._session_group.sessions:
+        if not self._session_router.sessions:
             raise RuntimeError("Client not connected to a server")
 
-        prompt_result = list(self._session_group.prompts.values())
+        prompt_result = list(self._session_router.prompts.values())
         if not prompt_result:
             logger.warning("No prompts found on server")
         return prompt_result
@@ -350,5 +741,20 @@ class MCPClient:
         """
         Clean up any resources
         """
-        for session in self._session_group.sessions:
-            await self._session_group.disconnect_from_server(session)
+        for session in self._session_router.sessions:
+            self._session_router.remove(session)
+        self._sampling_cache_sessions.clear()
+        if self.cancellation_stats.cancelled_sampling_requests:
+            logger.info(f"Cancelled requests: {self.cancellation_stats.summary()}")
+        # Sessions opened by connect have to be closed from this task, so they are
+        # closed one by one, and one failing to close does not leave the rest open
+        errors = []
+        for close_session in reversed(list(self._session_closers.values())):
+            try:
+                await close_session()
+            except Exception as error:
+                logger.exception("Failed to close a session")
+                errors.append(error)
+        self._session_closers.clear()
+        if errors:
+            raise ExceptionGroup("Some sessions did not close cleanly", errors)
@@ -0,0 +1,184 @@
+import logging
+from contextlib import suppress
+from contextvars import ContextVar
+from typing import Any, Self
+
+import anthropic
+import anyio
+import httpx
+from anyio.abc import TaskStatus
+from mcp import ClientSession
+from mcp.client.session import ClientResponse
+from mcp.shared.context import RequestContext
+from mcp.shared.exceptions import McpError
+from mcp.shared.message import SessionMessage
+from mcp.shared.session import RequestId, RequestResponder
+from mcp.types import (
+    INTERNAL_ERROR,
+    CancelledNotification,
+    CancelledNotificationParams,
+    ClientNotification,
+    ClientResult,
+    CreateMessageRequest,
+    ElicitRequest,
+    ErrorData,
+    JSONRPCRequest,
+    ServerRequest,
+)
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Set in the task sending a request, to collect the ID the request goes out with
+_sent_request_ids: ContextVar[list[RequestId] | None] = ContextVar(
+    "_sent_request_ids", default=None
+)
+
+
+class _RequestIdRecorder:
+    """
+    Write stream of a session that hands the ID of each outgoing request to the
+    task sending it. BaseSession.send_request writes the request from the task
+    that called it, so the ID always reaches the right sender.
+    """
+
+    def __init__(self, stream: Any) -> None:
+        self._stream = stream
+
+    async def send(self, message: SessionMessage) -> None:
+        sent_request_ids = _sent_request_ids.get()
+        if sent_request_ids is not None and isinstance(
+            message.message.root, JSONRPCRequest
+        ):
+            sent_request_ids.append(message.message.root.id)
+        await self._stream.send(message)
+
+    async def __aenter__(self) -> Self:
+        await self._stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> bool | None:
+        return await self._stream.__aexit__(*exc_info)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+class ConcurrentClientSession(ClientSession):
+    """
+    ClientSession that runs sampling and elicitation requests in their own tasks,
+    and tells the server when it gives up on a request of its own.
+
+    The stock ClientSession awaits these callbacks inside its receive loop, so a
+    notifications/cancelled from the server is not read until the callback has
+    already finished. Running them off the loop lets the cancellation cancel the
+    callback while it is still working.
+
+    The stock session also stops waiting for a request that is cancelled or
+    times out without telling the server, which carries on with it. This one
+    sends notifications/cancelled for it.
+    """
+
+    def __init__(self, read_stream: Any, write_stream: Any, **kwargs: Any) -> None:
+        super().__init__(read_stream, _RequestIdRecorder(write_stream), **kwargs)
+
+    async def send_request(
+        self, request: Any, result_type: Any, **kwargs: Any
+    ) -> Any:
+        sent_request_ids: list[RequestId] = []
+        token = _sent_request_ids.set(sent_request_ids)
+        try:
+            return await super().send_request(request, result_type, **kwargs)
+        except anyio.get_cancelled_exc_class():
+            with anyio.CancelScope(shield=True):
+                await self._cancel_on_server(sent_request_ids, "Cancelled by client")
+            raise
+        except McpError as error:
+            if error.error.code == httpx.codes.REQUEST_TIMEOUT:
+                await self._cancel_on_server(sent_request_ids, error.error.message)
+            raise
+        finally:
+            _sent_request_ids.reset(token)
+
+    async def _cancel_on_server(
+        self, request_ids: list[RequestId], reason: str
+    ) -> None:
+        for request_id in request_ids:
+            # A closed connection has nothing left to cancel
+            with (
+                anyio.move_on_after(1),
+                suppress(anyio.ClosedResourceError, anyio.BrokenResourceError),
+            ):
+                await self.send_notification(
+                    ClientNotification(
+                        CancelledNotification(
+                            params=CancelledNotificationParams(
+                                requestId=request_id, reason=reason
+                            )
+                        )
+                    )
+                )
+
+    async def _received_request(
+        self, responder: RequestResponder[ServerRequest, ClientResult]
+    ) -> None:
+        match responder.request.root:
+            case CreateMessageRequest(params=params):
+                await self._task_group.start(
+                    self._respond_in_task, responder, self._sampling_callback, params
+                )
+            case ElicitRequest(params=params):
+                await self._task_group.start(
+                    self._respond_in_task,
+                    responder,
+                    self._elicitation_callback,
+                    params,
+                )
+            case _:
+                await super()._received_request(responder)
+
+    async def _respond_in_task(
+        self,
+        responder: RequestResponder[ServerRequest, ClientResult],
+        callback: Any,
+        params: Any,
+        *,
+        task_status: TaskStatus[None] = anyio.TASK_STATUS_IGNORED,
+    ) -> None:
+        context = RequestContext[ClientSession, Any](
+            request_id=responder.request_id,
+            meta=responder.request_meta,
+            session=self,
+            lifespan_context=None,
+        )
+        # Entering the responder before reporting the task as started means a
+        # cancellation can never arrive before its cancel scope exists
+        try:
+            with responder:
+                task_status.started()
+                try:
+                    response = await callback(context, params)
+                    client_response = ClientResponse.validate_python(response)
+                except McpError as e:
+                    await responder.respond(e.error)
+                    return
+                except (
+                    anthropic.APIError,
+                    ValidationError,
+                    OSError,
+                    EOFError,
+                ) as e:
+                    # Answer with an error, as the stock session does, instead of
+                    # letting a failed LLM call, a response that does not validate
+                    # or closed stdin take down the session's task group
+                    logger.warning(f"{type(params).__name__} callback failed: {e}")
+                    await responder.respond(
+                        ErrorData(code=INTERNAL_ERROR, message=str(e))
+                    )
+                    return
+                await responder.respond(client_response)
+        except anyio.get_cancelled_exc_class():
+            # RequestResponder does not swallow its own cancellation, so stop it
+            # here rather than letting it tear down the whole session
+            if not responder.cancelled:
+                raise
@@ -0,0 +1,171 @@
+import json
+from typing import Any
+
+from tokens import CHARS_PER_TOKEN
+
+# Rough token cost of an image block, which really depends on the image size
+IMAGE_TOKENS = 1600
+# Starts the text block that summarizes dropped tool calls
+SUMMARY_HEADER = "[Earlier tool calls, results shortened]"
+TRUNCATION_MARKER = "\n[Truncated]"
+OMITTED_PREFIX = "... "
+OMITTED_SUFFIX = " earlier calls omitted"
+
+
+def estimate_tokens(message: dict[str, Any]) -> int:
+    """Rough token count of a message, from the length of its content."""
+    content = message["content"]
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + 1
+    return sum(_estimate_block_tokens(block) for block in content)
+
+
+def _estimate_block_tokens(block: Any) -> int:
+    if not isinstance(block, dict):
+        block = block.model_dump(exclude_none=True)
+    if block.get("type") == "image":
+        return IMAGE_TOKENS
+    return len(json.dumps(block, default=str)) // CHARS_PER_TOKEN + 1
+
+
+def _block_field(block: Any, field: str) -> Any:
+    return block.get(field) if isinstance(block, dict) else getattr(block, field)
+
+
+class ContextCompactor:
+    """
+    Keeps the messages of a tool use loop within a token budget, so each request
+    of a long chain of tool calls sends about the same input instead of the
+    whole history.
+
+    A step is an assistant message with tool calls and the user message with
+    their results. Earlier turns of the conversation, the turn's first message,
+    with the query and resources, and the last keep_recent_steps steps are
+    always kept whole. Past max_tokens, the results of older steps are cut to
+    max_tool_result_tokens, and if that is not enough the oldest steps are
+    dropped, leaving a one-line summary of each of their calls at the end of
+    the turn's first message. The summary keeps only the latest calls that fit
+    in max_summary_tokens. Token counts are estimated from the length of the
+    messages.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 20_000,
+        keep_recent_steps: int = 2,
+        max_tool_result_tokens: int = 200,
+        max_summary_tokens: int = 1000,
+    ) -> None:
+        self.max_tokens = max_tokens
+        self.keep_recent_steps = keep_recent_steps
+        self.max_tool_result_tokens = max_tool_result_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.truncated_results = 0
+        self.dropped_steps = 0
+        self.tokens_saved = 0
+
+    def compact(self, messages: list[dict[str, Any]], first_index: int = 0) -> None:
+        """
+        Compact the messages in place, if they are over the budget. The turn
+        starts at first_index, after any earlier turns of the conversation.
+        """
+        estimates = [estimate_tokens(message) for message in messages]
+        total = sum(estimates)
+        if total <= self.max_tokens:
+            return
+
+        # Steps are the assistant and user message pairs after the turn's
+        # first message, of which only the older ones can be compacted
+        old_steps = max(
+            (len(messages) - first_index - 1) // 2 - self.keep_recent_steps, 0
+        )
+        for step in range(old_steps):
+            index = first_index + 2 + step * 2
+            self._truncate_results(messages[index])
+            estimate = estimate_tokens(messages[index])
+            self.tokens_saved += estimates[index] - estimate
+            total -= estimates[index] - estimate
+            estimates[index] = estimate
+
+        dropped = 0
+        summary_lines = []
+        while dropped < old_steps and total > self.max_tokens:
+            assistant_message, results_message = messages[
+                first_index + 1 : first_index + 3
+            ]
+            summary_lines.extend(
+                summarize_tool_calls(
+                    assistant_message["content"], results_message["content"]
+                )
+            )
+            del messages[first_index + 1 : first_index + 3]
+            saved = estimates.pop(first_index + 1) + estimates.pop(first_index + 1)
+            self.tokens_saved += saved
+            total -= saved
+            dropped += 1
+        if dropped:
+            self.dropped_steps += dropped
+            self._add_summary(messages[first_index], summary_lines)
+            self.tokens_saved -= (
+                estimate_tokens(messages[first_index]) - estimates[first_index]
+            )
+
+    def _truncate_results(self, message: dict[str, Any]) -> None:
+        max_chars = self.max_tool_result_tokens * CHARS_PER_TOKEN
+        for block in message["content"]:
+            if (
+                isinstance(block, dict)
+                and block.get("type") == "tool_result"
+                and isinstance(block.get("content"), str)
+                and len(block["content"]) > max_chars + len(TRUNCATION_MARKER)
+            ):
+                block["content"] = block["content"][:max_chars] + TRUNCATION_MARKER
+                self.truncated_results += 1
+
+    def _add_summary(self, message: dict[str, Any], lines: list[str]) -> None:
+        # The summary goes after the query and resources, so the cached prefix
+        # of the first message stays the same
+        content = message["content"]
+        omitted = 0
+        if (
+            content
+            and _block_field(content[-1], "type") == "text"
+            and _block_field(content[-1], "text").startswith(SUMMARY_HEADER)
+        ):
+            earlier_lines = content.pop()["text"].split("\n")[1:]
+            if earlier_lines and earlier_lines[0].endswith(OMITTED_SUFFIX):
+                omitted = int(
+                    earlier_lines.pop(0)
+                    .removeprefix(OMITTED_PREFIX)
+                    .removesuffix(OMITTED_SUFFIX)
+                )
+            lines = earlier_lines + lines
+
+        max_chars = self.max_summary_tokens * CHARS_PER_TOKEN
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > max_chars:
+            lines.pop(0)
+            omitted += 1
+        if omitted:
+            lines.insert(0, f"{OMITTED_PREFIX}{omitted}{OMITTED_SUFFIX}")
+        content.append({"type": "text", "text": "\n".join([SUMMARY_HEADER, *lines])})
+
+
+def summarize_tool_calls(
+    assistant_content: list[Any], results_content: list[Any]
+) -> list[str]:
+    """One line for each tool call in assistant_content, with its result."""
+    results = {
+        block["tool_use_id"]: str(block.get("content", ""))
+        for block in results_content
+        if isinstance(block, dict) and block.get("type") == "tool_result"
+    }
+    lines = []
+    for block in assistant_content:
+        if _block_field(block, "type") != "tool_use":
+            continue
+        result = results.get(_block_field(block, "id"), "").replace("\n", " ")
+        lines.append(
+            f"{_block_field(block, 'name')}"
+            f"({json.dumps(_block_field(block, 'input'))}) -> {result[:100]}"
+        )
+    return lines
@@ -0,0 +1,176 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+from urllib.parse import quote
+
+from context_compactor import estimate_tokens
+
+# Stands in for a resource that is already attached earlier in the conversation
+REFERENCE_BLOCK = {
+    "type": "text",
+    "text": "[Resource attached earlier in this conversation, not repeated]",
+}
+
+
+class ConversationStore:
+    """
+    History of each conversation, kept between queries as one compact record
+    per turn: the query, the resources attached to it, a line for each tool
+    call and the answer. The intermediate messages of the tool use loop are not
+    kept, so later turns re-send only what was asked and answered.
+
+    Attached resource contents are kept once, by hash, however many turns and
+    conversations attach them, and sent once per conversation.
+
+    With a directory, each conversation's turns are appended to a JSON lines
+    file as they finish, resource contents are written once to files named by
+    hash, and both are loaded again on first use.
+    """
+
+    def __init__(
+        self, directory: Path | None = None, max_history_tokens: int = 8000
+    ) -> None:
+        self.directory = directory
+        self.max_history_tokens = max_history_tokens
+        self._turns: dict[str, list[dict[str, Any]]] = {}
+        self._blobs: dict[str, dict[str, Any]] = {}
+        if directory is not None:
+            (directory / "blobs").mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def blob_hash(block: dict[str, Any]) -> str:
+        """Hash of a block's content, hashing image data as it is."""
+        if block.get("type") == "image" and block["source"]["type"] == "base64":
+            source = block["source"]
+            return hashlib.sha256(
+                f"{source['media_type']}:{source['data']}".encode()
+            ).hexdigest()
+        return hashlib.sha256(
+            json.dumps(_without_cache_control(block), sort_keys=True).encode()
+        ).hexdigest()
+
+    def _conversation_path(self, conversation_id: str) -> Path:
+        return self.directory / f"{quote(conversation_id, safe='')}.jsonl"
+
+    def _blob_path(self, blob_hash: str) -> Path:
+        return self.directory / "blobs" / f"{blob_hash}.json"
+
+    def turns(self, conversation_id: str) -> list[dict[str, Any]]:
+        """The turns of a conversation so far, loading them on first use."""
+        if conversation_id not in self._turns:
+            turns = []
+            if self.directory is not None:
+                path = self._conversation_path(conversation_id)
+                if path.exists():
+                    turns = [
+                        json.loads(line) for line in path.read_text().splitlines()
+                    ]
+            self._turns[conversation_id] = turns
+        return self._turns[conversation_id]
+
+    def _store_blob(self, block: dict[str, Any]) -> str:
+        blob_hash = self.blob_hash(block)
+        if blob_hash not in self._blobs:
+            block = _without_cache_control(block)
+            self._blobs[blob_hash] = block
+            if self.directory is not None:
+                path = self._blob_path(blob_hash)
+                if not path.exists():
+                    path.write_text(json.dumps(block))
+        return blob_hash
+
+    def _blob(self, blob_hash: str) -> dict[str, Any]:
+        if blob_hash not in self._blobs:
+            self._blobs[blob_hash] = json.loads(
+                self._blob_path(blob_hash).read_text()
+            )
+        return self._blobs[blob_hash]
+
+    def record_turn(
+        self,
+        conversation_id: str,
+        query: str,
+        attachments: list[dict[str, Any]],
+        tool_calls: list[str],
+        answer: str,
+    ) -> None:
+        """Add a finished turn to the end of a conversation."""
+        turn = {
+            "query": query,
+            "attachments": [self._store_blob(block) for block in attachments],
+            "tool_calls": tool_calls,
+            "answer": answer,
+        }
+        self.turns(conversation_id).append(turn)
+        if self.directory is not None:
+            with self._conversation_path(conversation_id).open("a") as file:
+                file.write(json.dumps(turn) + "\n")
+
+    def refer_back(
+        self, blocks: list[dict[str, Any]], attached: set[str]
+    ) -> list[dict[str, Any]]:
+        """Blocks, with those whose content is already attached referred back to."""
+        return [
+            REFERENCE_BLOCK if self.blob_hash(block) in attached else block
+            for block in blocks
+        ]
+
+    def history(self, conversation_id: str) -> tuple[list[dict[str, Any]], set[str]]:
+        """
+        Messages for the latest turns of a conversation that fit in
+        max_history_tokens, oldest first, and the hashes of the resources they
+        attach. Each resource is attached once, by the first of these turns to
+        attach it, and later turns refer back to it, so attaching a resource
+        again leaves the earlier messages, and their cached prefix, as they
+        were.
+        """
+        # Pick the turns newest first, counting each resource once
+        turns = []
+        attached = set()
+        total = 0
+        for turn in reversed(self.turns(conversation_id)):
+            new_attachments = set(turn["attachments"]) - attached
+            tokens = sum(
+                estimate_tokens(message) for message in _turn_messages(turn, [])
+            ) + sum(
+                estimate_tokens({"content": [self._blob(blob_hash)]})
+                for blob_hash in new_attachments
+            )
+            if total + tokens > self.max_history_tokens:
+                break
+            total += tokens
+            attached |= new_attachments
+            turns.append(turn)
+
+        messages = []
+        seen = set()
+        for turn in reversed(turns):
+            blocks = []
+            for blob_hash in turn["attachments"]:
+                if blob_hash in seen:
+                    blocks.append(REFERENCE_BLOCK)
+                else:
+                    seen.add(blob_hash)
+                    blocks.append(self._blob(blob_hash))
+            messages.extend(_turn_messages(turn, blocks))
+        return messages, attached
+
+
+def _turn_messages(
+    turn: dict[str, Any], attachments: list[dict[str, Any]]
+) -> list[dict[str, Any]]:
+    answer = turn["answer"]
+    if turn["tool_calls"]:
+        answer = "\n".join(["[Tool calls]", *turn["tool_calls"], "", answer])
+    return [
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": turn["query"]}, *attachments],
+        },
+        {"role": "assistant", "content": [{"type": "text", "text": answer}]},
+    ]
+
+
+def _without_cache_control(block: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in block.items() if key != "cache_control"}
@@ -0,0 +1,187 @@
+import json
+import re
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Self
+
+from anthropic.lib.streaming import ContentBlockStopEvent, TextEvent
+from anthropic.types import Message, TextBlock, ToolUseBlock, Usage
+
+# The agent's selection prompts quote the user question like this
+QUERY_PATTERN = re.compile(r'Given this user question: "(.*?)"\n', re.DOTALL)
+
+
+class ScriptedLLM:
+    """
+    Stand-in for the Anthropic client that replays scripted responses, so the
+    agent can run without network access and always does the same work.
+
+    The script is a list of turns, each matched to a request by its user query:
+
+        [
+          {
+            "query": "What is 2 + 3?",
+            "resources": [],
+            "prompts": [{"name": "calculate_operation", "arguments": {...}}],
+            "responses": [
+              {"tool_use": [{"name": "add", "input": {"a": 2, "b": 3}}]},
+              {"text": "2 + 3 = 5"}
+            ]
+          }
+        ]
+
+    "resources" and "prompts" answer the agent's selection requests. The
+    responses answer the tool use loop in order: each response follows the one
+    whose tool calls were last answered. The step is read from the tool use IDs,
+    so it survives older steps being dropped from the history. Requests the
+    script does not cover, such as sampling requests from servers, get
+    default_text. latency is how long every request blocks, as the real client
+    does.
+    """
+
+    def __init__(
+        self,
+        turns: list[dict[str, Any]],
+        latency: float = 0.0,
+        default_text: str = "OK",
+    ) -> None:
+        self.turns = {turn["query"]: turn for turn in turns}
+        self.latency = latency
+        self.default_text = default_text
+        self.messages = ScriptedMessages(self)
+        self.requests = 0
+        # The agent calls the client from several worker threads at once
+        self._requests_lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: Path, **kwargs: Any) -> "ScriptedLLM":
+        return cls(json.loads(Path(path).read_text()), **kwargs)
+
+    def respond(self, request: dict[str, Any]) -> Message:
+        with self._requests_lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        messages = request["messages"]
+        first_content = messages[0]["content"]
+        if isinstance(first_content, str):
+            # Selection requests carry the query inside their instructions
+            match = QUERY_PATTERN.search(first_content)
+            turn = self.turns.get(match.group(1)) if match else None
+            if turn is not None and "available resources" in first_content:
+                return _message(
+                    request, [_text(json.dumps(turn.get("resources", [])))]
+                )
+            if turn is not None and "available prompt templates" in first_content:
+                return _message(
+                    request, [_text(json.dumps(turn.get("prompts", [])))]
+                )
+            return _message(request, [_text(self.default_text)])
+
+        if "tools" not in request:
+            return _message(request, [_text(self.default_text)])
+        # The turn starts at the last user message that is not tool results,
+        # after any earlier turns of the conversation
+        first_index = max(
+            index
+            for index, message in enumerate(messages)
+            if message["role"] == "user" and message["content"][0]["type"] == "text"
+        )
+        turn = self.turns.get(messages[first_index]["content"][0]["text"])
+        if turn is None:
+            return _message(request, [_text(self.default_text)])
+
+        step = _next_step(messages[first_index:])
+        responses = turn["responses"]
+        response = responses[min(step, len(responses) - 1)]
+        if "tool_use" in response:
+            return _message(
+                request,
+                [
+                    ToolUseBlock(
+                        type="tool_use",
+                        id=f"toolu_{step}_{index}",
+                        name=tool_use["name"],
+                        input=tool_use.get("input", {}),
+                    )
+                    for index, tool_use in enumerate(response["tool_use"])
+                ],
+                stop_reason="tool_use",
+            )
+        return _message(request, [_text(response["text"])])
+
+
+class ScriptedMessages:
+    """The messages resource of ScriptedLLM, with create and stream."""
+
+    def __init__(self, llm: ScriptedLLM) -> None:
+        self._llm = llm
+
+    def create(self, **request: Any) -> Message:
+        return self._llm.respond(request)
+
+    def stream(self, **request: Any) -> "ScriptedStream":
+        return ScriptedStream(self._llm.respond(request))
+
+
+class ScriptedStream:
+    """
+    Replays a scripted message as a stream: one text event for each text block,
+    and a content_block_stop event after every block.
+    """
+
+    def __init__(self, message: Message) -> None:
+        self.current_message_snapshot = message
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+    def __iter__(self) -> Iterator[TextEvent | ContentBlockStopEvent]:
+        for index, block in enumerate(self.current_message_snapshot.content):
+            if block.type == "text":
+                yield TextEvent(type="text", text=block.text, snapshot=block.text)
+            yield ContentBlockStopEvent(
+                type="content_block_stop", index=index, content_block=block
+            )
+
+    def get_final_message(self) -> Message:
+        return self.current_message_snapshot
+
+
+def _next_step(messages: list[dict[str, Any]]) -> int:
+    # Tool use IDs are toolu_<step>_<index>
+    for message in reversed(messages):
+        if message["role"] != "assistant":
+            continue
+        for block in message["content"]:
+            if block.type == "tool_use":
+                return int(block.id.split("_")[1]) + 1
+        return 1
+    return 0
+
+
+def _text(text: str) -> TextBlock:
+    return TextBlock(type="text", text=text)
+
+
+def _message(
+    request: dict[str, Any],
+    content: list[TextBlock | ToolUseBlock],
+    stop_reason: str = "end_turn",
+) -> Message:
+    return Message(
+        id="msg_scripted",
+        type="message",
+        role="assistant",
+        model=request.get("model", "scripted"),
+        content=content,
+        stop_reason=stop_reason,
+        stop_sequence=None,
+        usage=Usage(input_tokens=0, output_tokens=0),
+    )
@@ -0,0 +1,93 @@
+"""
+Run the agent on queries read from a file, one per line, instead of prompting
+for them with input(). Each answer is written to stdout as a JSON line with
+the time the turn spent in each phase.
+
+    python headless.py queries.txt
+    python headless.py queries.txt --script benchmark_script.json
+
+With --script the scripted fake LLM answers instead of Anthropic, so no
+network access or API key is needed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any
+
+from agent import Agent
+from anthropic import Anthropic
+from client import MCPClient
+from conversation_store import ConversationStore
+from fake_llm import ScriptedLLM
+from mcp import StdioServerParameters
+
+CALCULATOR_SERVER = Path(__file__).parent.parent.resolve() / "calculator_server.py"
+
+
+async def connect_agent(
+    llm_client: Anthropic | ScriptedLLM,
+    conversation_store: ConversationStore | None = None,
+    allow_elicitation: bool = True,
+) -> Agent:
+    """Start an agent connected to the calculator server over stdio."""
+    mcp_client = MCPClient(
+        name="headless_client",
+        llm_client=llm_client,
+        file_roots=[f"file:///{Path(__file__).parent.resolve()}"],
+        allow_elicitation=allow_elicitation,
+    )
+    await mcp_client.connect(
+        StdioServerParameters(command=sys.executable, args=[str(CALCULATOR_SERVER)])
+    )
+    agent = Agent(mcp_client, llm_client, conversation_store=conversation_store)
+    await agent.start()
+    return agent
+
+
+async def run_queries(agent: Agent, queries: list[str]) -> list[dict[str, Any]]:
+    """Answer each query in turn, returning the answers and turn timings."""
+    results = []
+    for query in queries:
+        timings = {}
+        answer = await agent.answer(query, timings)
+        results.append({"query": query, "answer": answer, "timings": timings})
+    return results
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("queries", type=Path, help="File with one query per line")
+    parser.add_argument("--script", type=Path, help="Answer with the fake LLM")
+    args = parser.parse_args()
+
+    queries = [
+        line.strip()
+        for line in args.queries.read_text().splitlines()
+        if line.strip()
+    ]
+    if args.script:
+        llm_client = ScriptedLLM.from_file(args.script)
+    else:
+        llm_client = Anthropic(api_key=os.environ["LLM_API_KEY"])
+
+    # The agent reports tool use with print(), which must not mix with the
+    # JSON lines on stdout
+    with redirect_stdout(sys.stderr):
+        agent = await connect_agent(llm_client)
+        try:
+            results = await run_queries(agent, queries)
+        finally:
+            await agent.mcp_client.disconnect()
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
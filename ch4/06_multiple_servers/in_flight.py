@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Literal
+
+from mcp import ClientSession
+from mcp.shared.session import RequestId
+from tokens import CHARS_PER_TOKEN
+
+
+class InFlightRequest:
+    """
+    A server-initiated request (sampling or elicitation) that the client is still
+    working on.
+    """
+
+    def __init__(
+        self,
+        session: ClientSession,
+        request_id: RequestId,
+        kind: Literal["sampling", "elicitation"],
+        max_tokens: int = 0,
+    ) -> None:
+        self.session = session
+        self.request_id = request_id
+        self.kind = kind
+        self.max_tokens = max_tokens
+        self.started_at = time.perf_counter()
+        # Set to stop the worker thread serving this request
+        self.abort = threading.Event()
+        # Updated from the worker thread while the LLM response streams in
+        self.generated_chars = 0
+
+    @property
+    def generated_tokens(self) -> int:
+        return self.generated_chars // CHARS_PER_TOKEN
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+
+class CancellationStats:
+    """Totals for server-initiated requests abandoned after a cancellation."""
+
+    def __init__(self) -> None:
+        self.cancelled_sampling_requests = 0
+        self.cancelled_elicitation_requests = 0
+        self.output_tokens_generated = 0
+        self.output_tokens_saved = 0
+        self.seconds_saved = 0.0
+
+    def record(self, request: InFlightRequest) -> None:
+        """
+        Record a cancelled request. Tokens saved is the unused part of the token
+        budget the server asked for; seconds saved extrapolates how long the rest
+        of that budget would have taken at the rate observed so far.
+        """
+        if request.kind == "elicitation":
+            self.cancelled_elicitation_requests += 1
+            return
+
+        self.cancelled_sampling_requests += 1
+        generated = request.generated_tokens
+        remaining = max(request.max_tokens - generated, 0)
+        self.output_tokens_generated += generated
+        self.output_tokens_saved += remaining
+        elapsed = request.elapsed()
+        if generated and elapsed > 0:
+            self.seconds_saved += remaining / (generated / elapsed)
+
+    def summary(self) -> dict[str, int | float]:
+        return {
+            "cancelled_sampling_requests": self.cancelled_sampling_requests,
+            "cancelled_elicitation_requests": self.cancelled_elicitation_requests,
+            "output_tokens_generated": self.output_tokens_generated,
+            "output_tokens_saved": self.output_tokens_saved,
+            "seconds_saved": round(self.seconds_saved, 3),
+        }
@@ -0,0 +1,60 @@
+from typing import Any
+
+from anthropic.types import Usage
+
+# Caches the prompt up to and including the block it is set on, for 5 minutes
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def with_cache_breakpoint(blocks: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Copy of blocks with a cache breakpoint on the last one, so later requests
+    that start with the same prompt read it from the cache instead of having
+    it processed again. Prefixes shorter than the model's minimum cacheable
+    length (1024 tokens for Sonnet) are not cached, but the breakpoint is
+    harmless.
+    """
+    if not blocks:
+        return blocks
+    return [*blocks[:-1], {**blocks[-1], "cache_control": CACHE_CONTROL}]
+
+
+class TokenUsage:
+    """
+    Totals of the tokens used by LLM requests. Input tokens read from or written
+    to the prompt cache are counted apart from input_tokens, as the API does.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+
+    def record(self, usage: Usage) -> None:
+        self.requests += 1
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        self.cache_creation_input_tokens += usage.cache_creation_input_tokens or 0
+        self.cache_read_input_tokens += usage.cache_read_input_tokens or 0
+
+    @property
+    def cache_read_share(self) -> float:
+        """Share of all input tokens that were read from the cache."""
+        total = (
+            self.input_tokens
+            + self.cache_creation_input_tokens
+            + self.cache_read_input_tokens
+        )
+        return self.cache_read_input_tokens / total if total else 0.0
+
+    def summary(self) -> dict[str, int | float]:
+        return {
+            "requests": self.requests,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_creation_input_tokens": self.cache_creation_input_tokens,
+            "cache_read_input_tokens": self.cache_read_input_tokens,
+            "cache_read_share": round(self.cache_read_share, 3),
+        }
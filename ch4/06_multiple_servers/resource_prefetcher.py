@@ -0,0 +1,84 @@
+import asyncio
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+ResourceLoader = Callable[[str], Awaitable[list[dict[str, Any]]]]
+
+
+class ResourcePrefetcher:
+    """
+    Starts reading the resources that queries select most often while the
+    selection LLM is still deciding which ones this query needs. Prefetched
+    resources that get selected are used as they are, and the others are
+    cancelled as soon as the selection is known.
+
+    Up to max_prefetch resources are prefetched per query, out of those selected by
+    at least min_selection_rate of the queries so far, so nothing is prefetched until
+    there is some history, and a prefetch is used more often than not. Hit rate is
+    the share of prefetched resources that were selected; coverage is the share of
+    selected resources that were prefetched.
+    """
+
+    def __init__(
+        self, max_prefetch: int = 2, min_selection_rate: float = 0.5
+    ) -> None:
+        self.max_prefetch = max_prefetch
+        self.min_selection_rate = min_selection_rate
+        self.selections: Counter[str] = Counter()
+        self.queries = 0
+        self.prefetched = 0
+        self.hits = 0
+        self.selected = 0
+
+    def candidates(self, available: Iterable[str]) -> list[str]:
+        """The available resources worth prefetching, most often selected first."""
+        available = set(available)
+        return [
+            name
+            for name, count in self.selections.most_common()
+            if name in available and count >= self.min_selection_rate * self.queries
+        ][: self.max_prefetch]
+
+    def start(
+        self, available: Iterable[str], load: ResourceLoader
+    ) -> dict[str, asyncio.Task[list[dict[str, Any]]]]:
+        """Start loading the candidates, returning their tasks by name."""
+        return {
+            name: asyncio.create_task(load(name))
+            for name in self.candidates(available)
+        }
+
+    def finish(
+        self,
+        selected: list[str],
+        prefetches: dict[str, asyncio.Task[list[dict[str, Any]]]],
+    ) -> None:
+        """Record a query's selection, and cancel the prefetches it missed."""
+        selected = set(selected)
+        for name, task in prefetches.items():
+            if name not in selected:
+                task.cancel()
+        self.queries += 1
+        self.selections.update(selected)
+        self.prefetched += len(prefetches)
+        self.hits += len(selected & prefetches.keys())
+        self.selected += len(selected)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.prefetched if self.prefetched else 0.0
+
+    @property
+    def coverage(self) -> float:
+        return self.hits / self.selected if self.selected else 0.0
+
+    def summary(self) -> dict[str, int | float]:
+        return {
+            "queries": self.queries,
+            "prefetched": self.prefetched,
+            "hits": self.hits,
+            "misses": self.prefetched - self.hits,
+            "hit_rate": round(self.hit_rate, 3),
+            "coverage": round(self.coverage, 3),
+        }
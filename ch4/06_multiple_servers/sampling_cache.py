@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+from mcp.types import CreateMessageRequestParams, CreateMessageResult
+
+
+class SamplingCache:
+    """
+    Cache of sampling responses with single-flight deduplication.
+
+    Identical sampling requests are answered from the cache, and identical
+    requests that arrive while the first one is still running wait for that call
+    instead of starting their own. The shared LLM call is only cancelled once
+    every request waiting on it has been cancelled.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float | None = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, CreateMessageResult]] = (
+            OrderedDict()
+        )
+        self._in_flight: dict[str, asyncio.Task[CreateMessageResult]] = {}
+        self._waiters: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+    @staticmethod
+    def key(params: CreateMessageRequestParams) -> str:
+        """
+        Build the cache key from the messages, token limit and model preferences,
+        plus the other request fields that change what the model produces.
+        """
+        return json.dumps(
+            params.model_dump(
+                mode="json",
+                include={
+                    "messages",
+                    "maxTokens",
+                    "modelPreferences",
+                    "systemPrompt",
+                    "temperature",
+                    "stopSequences",
+                },
+            ),
+            sort_keys=True,
+        )
+
+    def get(self, key: str) -> CreateMessageResult | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: CreateMessageResult) -> None:
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_create(
+        self,
+        key: str,
+        create: Callable[[], Awaitable[CreateMessageResult]],
+    ) -> CreateMessageResult:
+        """
+        Return the cached result for key, join an identical call already in
+        flight, or start a new call with create.
+        """
+        if (result := self.get(key)) is not None:
+            self.hits += 1
+            return result
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(create())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.deduplicated += 1
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters.get(key) == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def _finish(self, key: str, task: asyncio.Task[CreateMessageResult]) -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+        }
@@ -0,0 +1,126 @@
+import re
+from typing import Any
+
+from mcp.types import ModelPreferences
+
+# How much a matching hint adds to a model's score. The first hint gets the full
+# weight and later hints progressively less, since servers list them in order of
+# preference.
+HINT_WEIGHT = 1.0
+
+
+class ModelProfile:
+    """
+    A model the client can sample with, rated from 0 to 1 on the three axes of
+    MCP model preferences. Higher is better on every axis, so a cheap model has a
+    high cost score.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        cost: float,
+        speed: float,
+        intelligence: float,
+        aliases: list[str] | None = None,
+        llm_client: Any = None,
+    ) -> None:
+        self.name = name
+        self.cost = cost
+        self.speed = speed
+        self.intelligence = intelligence
+        # Names of comparable models, so hints for other providers still match
+        self.aliases = aliases or []
+        # Backend to send requests for this model to, if not the client's default
+        self.llm_client = llm_client
+
+    def matches_hint(self, hint: str) -> bool:
+        """
+        A hint matches if every part of it appears in the model name or one of its
+        aliases, so "claude-haiku", "haiku" and "claude-4-5-haiku" all match
+        "claude-haiku-4-5".
+        """
+        hint_parts = _name_parts(hint)
+        if not hint_parts:
+            return False
+        return any(
+            hint_parts <= _name_parts(name) for name in [self.name, *self.aliases]
+        )
+
+
+def _name_parts(name: str) -> set[str]:
+    return set(re.split(r"[-_.\s/]+", name.lower())) - {""}
+
+
+DEFAULT_MODELS = [
+    ModelProfile(
+        name="claude-haiku-4-5",
+        cost=1.0,
+        speed=1.0,
+        intelligence=0.5,
+        aliases=["gpt-4o-mini", "gemini-flash"],
+    ),
+    ModelProfile(
+        name="claude-sonnet-4-0",
+        cost=0.5,
+        speed=0.6,
+        intelligence=0.8,
+        aliases=["gpt-4o", "gpt-4.1", "gemini-pro"],
+    ),
+    ModelProfile(
+        name="claude-opus-4-1",
+        cost=0.1,
+        speed=0.3,
+        intelligence=1.0,
+        aliases=["o1", "o3"],
+    ),
+]
+
+
+class SamplingRouter:
+    """
+    Picks the model for a sampling request from the server's ModelPreferences.
+    """
+
+    def __init__(
+        self,
+        models: list[ModelProfile] | None = None,
+        default_model: str = "claude-sonnet-4-0",
+    ) -> None:
+        self.models = models or DEFAULT_MODELS
+        self.default_model = next(
+            model for model in self.models if model.name == default_model
+        )
+
+    def score(self, model: ModelProfile, preferences: ModelPreferences) -> float:
+        score = (
+            (preferences.costPriority or 0) * model.cost
+            + (preferences.speedPriority or 0) * model.speed
+            + (preferences.intelligencePriority or 0) * model.intelligence
+        )
+        for position, hint in enumerate(preferences.hints or []):
+            if hint.name and model.matches_hint(hint.name):
+                score += HINT_WEIGHT / (position + 1)
+                break
+        return score
+
+    def select(self, preferences: ModelPreferences | None) -> ModelProfile:
+        """
+        Return the best-scoring model, or the default model when the server
+        expressed no preferences. Ties go to the default model.
+        """
+        if preferences is None or not (
+            preferences.hints
+            or preferences.costPriority
+            or preferences.speedPriority
+            or preferences.intelligencePriority
+        ):
+            return self.default_model
+
+        return max(
+            self.models,
+            key=lambda model: (
+                self.score(model, preferences),
+                model is self.default_model,
+            ),
+        )
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from mcp import StdioServerParameters
+from mcp.client.stdio import get_default_environment
+
+logger = logging.getLogger(__name__)
+
+# Run inside the environment uv sets up, to find out what that environment is
+PROBE_SCRIPT = (
+    "import json, os, sys; print(json.dumps({'executable': sys.executable, "
+    "'path': sys.path, 'virtual_env': os.environ.get('VIRTUAL_ENV')}))"
+)
+BARE_PATH_SCRIPT = "import json, sys; print(json.dumps(sys.path))"
+# Files whose contents decide which environment uv resolves for a project
+PROJECT_FILES = ("pyproject.toml", "uv.lock", ".python-version")
+
+
+class ServerLauncher:
+    """
+    Rewrites `uv run` stdio server commands to run the server's Python directly.
+
+    `uv run` checks the lockfile and syncs the environment on every spawn before
+    the server even starts. The launcher asks uv for the environment once, stores
+    the interpreter, its sys.path and VIRTUAL_ENV in a cache file keyed on the
+    project's pyproject.toml and uv.lock, and from then on launches the
+    interpreter itself. Editing either file, or removing the environment, makes
+    the next launch ask uv again.
+
+    Only commands of the form `uv [global options] run <script or command>
+    [args]` are rewritten. Anything else, including `uv run` with options of its
+    own, is launched unchanged.
+    """
+
+    def __init__(self, cache_path: Path | None = None) -> None:
+        self.cache_path = cache_path or (
+            Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+            / "mcp-server-launcher.json"
+        )
+        self._cache: dict[str, dict] | None = None
+        self._lock = asyncio.Lock()
+
+    async def resolve(
+        self, server_parameters: StdioServerParameters
+    ) -> StdioServerParameters:
+        """Return parameters that launch the server without going through uv."""
+        parsed = _parse_uv_run(server_parameters)
+        if parsed is None:
+            return server_parameters
+        global_args, directory, project, command, args = parsed
+
+        async with self._lock:
+            key = _cache_key(project, server_parameters.env)
+            environment = self._load_cache().get(key)
+            if environment is None or not Path(environment["executable"]).exists():
+                environment = await self._probe(server_parameters, global_args)
+                self._cache[key] = environment
+                self._save_cache()
+
+        executable = environment["executable"]
+        if command.endswith(".py"):
+            launch = [executable, command, *args]
+        elif command in ("python", "python3"):
+            launch = [executable, *args]
+        else:
+            # A console script installed in the environment, such as `mcp`
+            script = Path(executable).parent / command
+            if not script.exists():
+                return server_parameters
+            launch = [str(script), *args]
+
+        env = dict(server_parameters.env or {})
+        bin_dir = str(Path(executable).parent)
+        env["PATH"] = os.pathsep.join(
+            [
+                bin_dir,
+                env.get("PATH", get_default_environment().get("PATH", os.defpath)),
+            ]
+        )
+        if environment["virtual_env"]:
+            env["VIRTUAL_ENV"] = environment["virtual_env"]
+        if environment["extra_path"]:
+            env["PYTHONPATH"] = os.pathsep.join(environment["extra_path"])
+
+        return server_parameters.model_copy(
+            update={
+                "command": launch[0],
+                "args": launch[1:],
+                "cwd": directory,
+                "env": env,
+            }
+        )
+
+    async def _probe(
+        self, server_parameters: StdioServerParameters, global_args: list[str]
+    ) -> dict:
+        """
+        Ask uv for the environment it would run the server in. Entries uv adds to
+        sys.path beyond the interpreter's own are kept so they can be passed on
+        through PYTHONPATH.
+        """
+        # The same environment stdio_client gives the server, so uv picks the
+        # environment the server would have run in
+        env = {**get_default_environment(), **(server_parameters.env or {})}
+        resolved = json.loads(
+            await _run(
+                [server_parameters.command, *global_args, "run", "python", "-c"]
+                + [PROBE_SCRIPT],
+                cwd=server_parameters.cwd,
+                env=env,
+            )
+        )
+        bare_path = json.loads(
+            await _run([resolved["executable"], "-c", BARE_PATH_SCRIPT], env=env)
+        )
+        resolved["extra_path"] = [
+            entry
+            for entry in resolved.pop("path")
+            if entry and entry not in bare_path
+        ]
+        logger.info(f"Resolved uv environment to {resolved['executable']}")
+        return resolved
+
+    def _load_cache(self) -> dict[str, dict]:
+        if self._cache is None:
+            try:
+                self._cache = json.loads(self.cache_path.read_text())
+            except (OSError, json.JSONDecodeError):
+                self._cache = {}
+        return self._cache
+
+    def _save_cache(self) -> None:
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps(self._cache, indent=2))
+        except OSError as error:
+            logger.warning(f"Could not write launcher cache: {error}")
+
+
+def _parse_uv_run(
+    server_parameters: StdioServerParameters,
+) -> tuple[list[str], str, str, str, list[str]] | None:
+    """
+    Split `uv [global options] run <command> [args]` into the global options, the
+    directory uv would run in, the project directory it would take the
+    environment from, the command and its arguments. As in uv, --directory
+    changes the directory the command runs in and the project is looked for
+    from, while --project changes only where the project is looked for,
+    relative to that directory.
+    """
+    if Path(server_parameters.command).name != "uv":
+        return None
+    args = server_parameters.args
+    if "run" not in args:
+        return None
+    run_index = args.index("run")
+    global_args = args[:run_index]
+    if run_index + 1 >= len(args) or args[run_index + 1].startswith("-"):
+        return None
+
+    directory = Path(server_parameters.cwd or os.getcwd())
+    if (value := _option_value(global_args, "--directory")) is not None:
+        directory = directory / value
+    project = directory
+    if (value := _option_value(global_args, "--project")) is not None:
+        project = directory / value
+    return (
+        global_args,
+        str(directory.resolve()),
+        str(project.resolve()),
+        args[run_index + 1],
+        args[run_index + 2 :],
+    )
+
+
+def _option_value(args: list[str], option: str) -> str | None:
+    """The value of the last occurrence of an option, as uv would take it."""
+    value = None
+    for index, arg in enumerate(args):
+        if arg == option and index + 1 < len(args):
+            value = args[index + 1]
+        elif arg.startswith(f"{option}="):
+            value = arg.removeprefix(f"{option}=")
+    return value
+
+
+def _cache_key(directory: str, env: dict[str, str] | None) -> str:
+    """
+    Key the cached environment on the project directory and the contents of the
+    project files, found by walking up from the directory as uv does.
+    """
+    digest = hashlib.sha256(directory.encode())
+    digest.update((env or {}).get("UV_PROJECT_ENVIRONMENT", "").encode())
+    for parent in [Path(directory), *Path(directory).parents]:
+        if (parent / "pyproject.toml").exists():
+            for name in PROJECT_FILES:
+                project_file = parent / name
+                if project_file.exists():
+                    digest.update(project_file.read_bytes())
+            break
+    return digest.hexdigest()
+
+
+async def _run(
+    command: list[str], cwd: str | Path | None = None, env: dict | None = None
+) -> str:
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        cwd=cwd,
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode:
+        raise RuntimeError(
+            f"{' '.join(command[:2])} exited with {process.returncode}: "
+            f"{stderr.decode().strip()}"
+        )
+    return stdout.decode().strip().splitlines()[-1]
@@ -0,0 +1,338 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, Self
+
+import anyio
+from concurrent_session import ConcurrentClientSession
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.context import RequestContext
+from mcp.shared.exceptions import McpError
+from mcp.types import (
+    INVALID_REQUEST,
+    CreateMessageRequestParams,
+    ElicitRequestParams,
+    ErrorData,
+    InitializeResult,
+    LoggingMessageNotificationParams,
+)
+from pydantic import ValidationError
+from server_launcher import ServerLauncher
+
+logger = logging.getLogger(__name__)
+
+# Errors from a server whose connection has closed or that has stopped answering
+UNREACHABLE_ERRORS = (
+    McpError,
+    OSError,
+    TimeoutError,
+    anyio.BrokenResourceError,
+    anyio.ClosedResourceError,
+)
+
+# Errors from spawning and initializing a server: those above, a failed launch
+# or an unsupported protocol version, and an initialize result that is invalid
+START_ERRORS = (*UNREACHABLE_ERRORS, RuntimeError, ValidationError)
+
+
+@asynccontextmanager
+async def stdio_transport(
+    server_parameters: StdioServerParameters,
+) -> AsyncIterator[tuple[Any, Any]]:
+    """
+    stdio_client, except that closing it does not fail when the server sends a
+    message after the session has stopped reading, such as the answer to a
+    request the client cancelled just before closing, or to the initialize
+    request when connecting is cancelled. stdio_client raises
+    BrokenResourceError when that message has nowhere to go.
+    """
+    closing = False
+    try:
+        async with stdio_client(server_parameters) as streams:
+            try:
+                yield streams
+            finally:
+                closing = True
+    except* anyio.BrokenResourceError:
+        if not closing:
+            raise
+        logger.debug(f"{server_parameters.command} sent a message while closing")
+
+
+class PooledServer:
+    """
+    A stdio server process with an initialized session, owned by a
+    StdioServerPool and lent to one MCPClient at a time.
+
+    The session is created before any client is known, so its callbacks forward
+    to whichever client's callbacks are attached at the time. Its capabilities
+    are fixed when it initializes, so elicitation is only advertised with
+    allow_elicitation, and only clients that allow it can use the server.
+    """
+
+    def __init__(
+        self,
+        server_parameters: StdioServerParameters,
+        allow_elicitation: bool = True,
+    ) -> None:
+        self.server_parameters = server_parameters
+        self.allow_elicitation = allow_elicitation
+        self.session: ClientSession | None = None
+        self.initialize_result: InitializeResult | None = None
+        self.uses = 0
+        self._callbacks: dict[str, Any] = {}
+        self._close = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def attach(self, callbacks: dict[str, Any]) -> None:
+        """Route the session's callbacks to a client's handlers."""
+        self._callbacks = callbacks
+
+    def detach(self) -> None:
+        self._callbacks = {}
+
+    async def start(self) -> None:
+        """
+        Spawn the process and initialize its session. The process is held open by
+        a task of its own, so the transport is entered and exited in one task
+        whichever task later asks for it to be closed.
+        """
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._hold(ready))
+        try:
+            await asyncio.shield(ready)
+        except BaseException:
+            self._task.cancel()
+            raise
+
+    async def close(self) -> None:
+        self._close.set()
+        if self._task is not None:
+            await self._task
+
+    async def _hold(self, ready: asyncio.Future[None]) -> None:
+        callbacks = {
+            "logging_callback": self._handle_logs,
+            "sampling_callback": self._handle_sampling,
+            "list_roots_callback": self._handle_roots,
+        }
+        if self.allow_elicitation:
+            callbacks["elicitation_callback"] = self._handle_elicitation
+        async with AsyncExitStack() as session_stack:
+            try:
+                read, write = await session_stack.enter_async_context(
+                    stdio_transport(self.server_parameters)
+                )
+                self.session = await session_stack.enter_async_context(
+                    ConcurrentClientSession(
+                        read_stream=read, write_stream=write, **callbacks
+                    )
+                )
+                self.initialize_result = await self.session.initialize()
+            except START_ERRORS as error:
+                ready.set_exception(error)
+                return
+            ready.set_result(None)
+            await self._close.wait()
+
+    async def _handle_logs(self, params: LoggingMessageNotificationParams) -> None:
+        if callback := self._callbacks.get("logging_callback"):
+            await callback(params)
+
+    async def _handle_sampling(
+        self,
+        context: RequestContext[ClientSession, Any],
+        params: CreateMessageRequestParams,
+    ) -> Any:
+        if callback := self._callbacks.get("sampling_callback"):
+            return await callback(context, params)
+        return ErrorData(code=INVALID_REQUEST, message="No client attached")
+
+    async def _handle_roots(
+        self, context: RequestContext[ClientSession, Any]
+    ) -> Any:
+        if callback := self._callbacks.get("list_roots_callback"):
+            return await callback(context)
+        return ErrorData(code=INVALID_REQUEST, message="No client attached")
+
+    async def _handle_elicitation(
+        self,
+        context: RequestContext[ClientSession, Any],
+        params: ElicitRequestParams,
+    ) -> Any:
+        if callback := self._callbacks.get("elicitation_callback"):
+            return await callback(context, params)
+        return ErrorData(code=INVALID_REQUEST, message="No client attached")
+
+
+class StdioServerPool:
+    """
+    Pool of pre-spawned, pre-initialized stdio server processes.
+
+    Spawning a stdio server means starting an interpreter, importing the server
+    and running the initialize handshake, which takes seconds. The pool keeps
+    size processes ready so that connecting only has to take one, and puts
+    processes back after a client disconnects if they still answer a ping. No
+    more than max_processes are ever running, counting those being started and
+    those lent out. The processes advertise elicitation to their servers only
+    with allow_elicitation, which has to match the clients that use the pool.
+    """
+
+    def __init__(
+        self,
+        server_parameters: StdioServerParameters,
+        size: int = 2,
+        max_processes: int = 8,
+        max_uses: int | None = None,
+        health_check_timeout: float = 2.0,
+        launcher: ServerLauncher | None = None,
+        allow_elicitation: bool = True,
+    ) -> None:
+        self.server_parameters = server_parameters
+        self.size = size
+        self.max_processes = max_processes
+        # Retire a process after this many clients have used it
+        self.max_uses = max_uses
+        self.health_check_timeout = health_check_timeout
+        self.launcher = launcher
+        self.allow_elicitation = allow_elicitation
+        self._idle: deque[PooledServer] = deque()
+        self._processes = 0
+        self._starting = 0
+        self._closed = False
+        self._condition = asyncio.Condition()
+        self._background_tasks: set[asyncio.Task] = set()
+
+    async def __aenter__(self) -> Self:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+    async def start(self) -> None:
+        """Spawn the initial warm processes."""
+        self._replenish()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+    async def acquire(self) -> PooledServer:
+        """
+        Take a warm process, spawning one if none are idle and the process cap
+        allows it, or waiting for one to be released otherwise.
+        """
+        while True:
+            async with self._condition:
+                while not self._idle and self._processes >= self.max_processes:
+                    if self._closed:
+                        raise RuntimeError("Server pool is closed")
+                    await self._condition.wait()
+                if self._closed:
+                    raise RuntimeError("Server pool is closed")
+                server = self._idle.popleft() if self._idle else None
+                if server is None:
+                    self._processes += 1
+
+            if server is None:
+                server = await self._spawn()
+            elif not await self._healthy(server):
+                await self._discard(server)
+                continue
+
+            server.uses += 1
+            self._replenish()
+            return server
+
+    async def release(self, server: PooledServer) -> None:
+        """
+        Take a process back from a client. It goes back into the pool if it is
+        still healthy and the pool has room for it; otherwise it is shut down.
+        """
+        server.detach()
+        retire = self._closed or (
+            self.max_uses is not None and server.uses >= self.max_uses
+        )
+        if retire or len(self._idle) >= self.size or not await self._healthy(server):
+            await self._discard(server)
+            self._replenish()
+            return
+        async with self._condition:
+            self._idle.append(server)
+            self._condition.notify()
+
+    async def aclose(self) -> None:
+        """Shut down the idle processes. Lent processes shut down on release."""
+        self._closed = True
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        while self._idle:
+            await self._discard(self._idle.popleft())
+        async with self._condition:
+            self._condition.notify_all()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "idle": len(self._idle),
+            "starting": self._starting,
+            "processes": self._processes,
+        }
+
+    async def _spawn(self) -> PooledServer:
+        """Start a process the caller has already counted in _processes."""
+        try:
+            server_parameters = self.server_parameters
+            if self.launcher is not None:
+                server_parameters = await self.launcher.resolve(server_parameters)
+            server = PooledServer(server_parameters, self.allow_elicitation)
+            await server.start()
+        except BaseException:
+            self._processes -= 1
+            async with self._condition:
+                self._condition.notify()
+            raise
+        return server
+
+    async def _spawn_idle(self) -> None:
+        try:
+            server = await self._spawn()
+        except START_ERRORS as error:
+            logger.warning(f"Could not start a pooled server: {error!r}")
+            return
+        finally:
+            self._starting -= 1
+        async with self._condition:
+            self._idle.append(server)
+            self._condition.notify()
+
+    def _replenish(self) -> None:
+        """Start processes in the background until size are idle or starting."""
+        while (
+            not self._closed
+            and len(self._idle) + self._starting < self.size
+            and self._processes < self.max_processes
+        ):
+            self._processes += 1
+            self._starting += 1
+            task = asyncio.create_task(self._spawn_idle())
+            task.add_done_callback(self._background_tasks.discard)
+            self._background_tasks.add(task)
+
+    async def _healthy(self, server: PooledServer) -> bool:
+        try:
+            async with asyncio.timeout(self.health_check_timeout):
+                await server.session.send_ping()
+        except UNREACHABLE_ERRORS as error:
+            logger.warning(f"Pooled server failed its health check: {error!r}")
+            return False
+        return True
+
+    async def _discard(self, server: PooledServer) -> None:
+        try:
+            await server.close()
+        finally:
+            self._processes -= 1
+            async with self._condition:
+                self._condition.notify()
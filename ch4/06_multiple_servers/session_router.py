@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Literal, TypeVar
+
+import anyio
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, Prompt, Resource, Tool
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ComponentKind = Literal["tool", "resource", "prompt"]
+
+# Errors that say the server itself is gone rather than that the request was bad
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError)
+
+
+class NoHealthyReplicaError(RuntimeError):
+    """Raised when every session that provides a component has failed."""
+
+
+class Replica:
+    """Routing state for one connected session."""
+
+    def __init__(self, session: ClientSession, name: str) -> None:
+        self.session = session
+        self.name = name
+        self.unhealthy_until = 0.0
+        # Exponentially weighted average of request latency
+        self.latency = 0.0
+        # When each request still running was sent, oldest first
+        self.started: list[float] = []
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    @property
+    def outstanding(self) -> int:
+        return len(self.started)
+
+    @property
+    def expected_latency(self) -> float:
+        """
+        Latency to expect from this replica: its average, or longer if its oldest
+        request has already been running longer than that, as on a hung server.
+        """
+        waited = time.perf_counter() - self.started[0] if self.started else 0.0
+        return max(self.latency, waited)
+
+
+class SessionRouter:
+    """
+    Index of which sessions provide each tool, resource and prompt, used to route
+    requests across connected servers.
+
+    Several servers may provide the same component, in which case they are treated
+    as replicas: each request goes to the healthy replica expected to answer
+    soonest, weighing its outstanding requests by its latency, and if that
+    replica's connection has closed, the request is retried on the next one. A
+    replica whose connection closes is skipped for cooldown seconds. A replica
+    whose requests have been running a long time counts as that slow, so a
+    stalled server is passed over before any of its requests time out.
+
+    Requests have no time limit unless request_timeout, or the timeout of a single
+    route, is set. Tools that wait on elicitation or sampling can take as long as
+    a person or an LLM does. A request that runs out of time is cancelled on its
+    server and raises TimeoutError, without marking the replica unhealthy, as a
+    slow call says nothing about whether the server is up. It is only retried on
+    the next replica for routes that ask for it, as a tool call may already have
+    had its effect on the slow server.
+    """
+
+    def __init__(
+        self, request_timeout: float | None = None, cooldown: float = 30.0
+    ) -> None:
+        self.request_timeout = request_timeout
+        self.cooldown = cooldown
+        self._replicas: dict[ClientSession, Replica] = {}
+        self._index: dict[ComponentKind, dict[str, list[Replica]]] = {
+            "tool": {},
+            "resource": {},
+            "prompt": {},
+        }
+        # The first definition seen for each component, which is what gets listed
+        self.tools: dict[str, Tool] = {}
+        self.resources: dict[str, Resource] = {}
+        self.prompts: dict[str, Prompt] = {}
+
+    @property
+    def sessions(self) -> list[ClientSession]:
+        return list(self._replicas)
+
+    def add(
+        self,
+        session: ClientSession,
+        name: str,
+        tools: list[Tool],
+        resources: list[Resource],
+        prompts: list[Prompt],
+    ) -> None:
+        """
+        Register a session and the components it provides. Resources are indexed
+        by URI and tools and prompts by name.
+        """
+        replica = Replica(session, name)
+        self._replicas[session] = replica
+        for tool in tools:
+            self._index["tool"].setdefault(tool.name, []).append(replica)
+            self.tools.setdefault(tool.name, tool)
+        for resource in resources:
+            uri = str(resource.uri)
+            self._index["resource"].setdefault(uri, []).append(replica)
+            self.resources.setdefault(uri, resource)
+        for prompt in prompts:
+            self._index["prompt"].setdefault(prompt.name, []).append(replica)
+            self.prompts.setdefault(prompt.name, prompt)
+
+    def remove(self, session: ClientSession) -> None:
+        """Drop a session, and any components no other session provides."""
+        replica = self._replicas.pop(session, None)
+        if replica is None:
+            return
+        catalogs = {
+            "tool": self.tools,
+            "resource": self.resources,
+            "prompt": self.prompts,
+        }
+        for kind, index in self._index.items():
+            for key in list(index):
+                index[key] = [other for other in index[key] if other is not replica]
+                if not index[key]:
+                    del index[key]
+                    del catalogs[kind][key]
+
+    def candidates(self, kind: ComponentKind, key: str) -> list[Replica]:
+        """
+        Healthy replicas for a component, the one expected to answer soonest
+        first. If none are healthy, all of them are returned so the request still
+        gets a chance rather than failing outright.
+        """
+        if key not in self._index[kind]:
+            raise KeyError(f"No connected server provides {kind} {key}")
+        replicas = self._index[kind][key]
+        healthy = [replica for replica in replicas if replica.healthy]
+        return sorted(
+            healthy or replicas,
+            key=lambda replica: (
+                (replica.outstanding + 1) * replica.expected_latency,
+                replica.outstanding,
+            ),
+        )
+
+    async def route(
+        self,
+        kind: ComponentKind,
+        key: str,
+        operation: Callable[[ClientSession], Awaitable[T]],
+        timeout: float | None = None,
+        retry_on_timeout: bool = False,
+    ) -> T:
+        """
+        Run operation against the best replica for a component, failing over to
+        the others if its connection is closed, or if it runs out of time and
+        retry_on_timeout is set. Only set it for operations that are safe to run
+        twice, such as reading a resource. The timeout defaults to
+        request_timeout and applies to each attempt.
+        """
+        timeout = timeout if timeout is not None else self.request_timeout
+        last_error: Exception | None = None
+        for replica in self.candidates(kind, key):
+            started_at = time.perf_counter()
+            replica.started.append(started_at)
+            try:
+                # The session tells the server when the request is cancelled
+                async with asyncio.timeout(timeout):
+                    result = await operation(replica.session)
+            except TimeoutError as error:
+                logger.warning(
+                    f"{replica.name} timed out on {kind} {key} after {timeout}s"
+                )
+                # Time spent so far is all that is known of its latency
+                self._record_latency(replica, time.perf_counter() - started_at)
+                if not retry_on_timeout:
+                    raise
+                last_error = error
+            except (McpError, *CONNECTION_ERRORS) as error:
+                if isinstance(error, McpError) and (
+                    error.error.code != CONNECTION_CLOSED
+                ):
+                    # The server answered with an error, so it is alive and
+                    # another replica would most likely answer the same way
+                    raise
+                logger.warning(f"{replica.name} is unreachable: {error!r}")
+                self._record_failure(replica)
+                last_error = error
+            else:
+                self._record_success(replica, time.perf_counter() - started_at)
+                return result
+            finally:
+                replica.started.remove(started_at)
+
+        if isinstance(last_error, TimeoutError):
+            raise TimeoutError(
+                f"Every server providing {kind} {key} timed out"
+            ) from last_error
+        raise NoHealthyReplicaError(
+            f"Every server providing {kind} {key} failed"
+        ) from last_error
+
+    def _record_success(self, replica: Replica, latency: float) -> None:
+        replica.unhealthy_until = 0.0
+        self._record_latency(replica, latency)
+
+    def _record_latency(self, replica: Replica, latency: float) -> None:
+        replica.latency = (
+            latency if not replica.latency else 0.8 * replica.latency + 0.2 * latency
+        )
+
+    def _record_failure(self, replica: Replica) -> None:
+        replica.unhealthy_until = time.monotonic() + self.cooldown
+        logger.warning(
+            f"Not routing to {replica.name} for the next {self.cooldown}s"
+        )
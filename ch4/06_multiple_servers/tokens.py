@@ -0,0 +1,4 @@
+# Rough characters-per-token ratio, for estimating token counts without a
+# tokenizer: while a response is still streaming and the API has not yet reported
+# the real count, or when deciding how much history fits in a budget
+CHARS_PER_TOKEN = 4
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from typing import Any
+
+from anthropic.types import ToolUseBlock
+from client import MCPClient
+
+
+class ToolPipeline:
+    """
+    Runs the tool calls of one LLM response, each sent to its server as soon as
+    its tool_use block is complete, so tool latency overlaps the generation of
+    the rest of the response. The tool results still follow block order,
+    whatever order the calls finish in.
+    """
+
+    def __init__(self, mcp_client: MCPClient) -> None:
+        self.mcp_client = mcp_client
+        self._tasks: dict[str, asyncio.Task[list[str]]] = {}
+        self._started_at: dict[str, float] = {}
+        self._finished_at: dict[str, float] = {}
+        self._response_finished_at: float | None = None
+
+    def start(self, tool_use: ToolUseBlock) -> None:
+        """Send a tool call, unless it has already been sent."""
+        if tool_use.id in self._tasks:
+            return
+        print(f"Using tool: {tool_use.name}")
+        self._started_at[tool_use.id] = time.perf_counter()
+        task = asyncio.create_task(
+            self.mcp_client.use_tool(
+                tool_name=tool_use.name, arguments=tool_use.input
+            )
+        )
+        task.add_done_callback(
+            lambda _: self._finished_at.setdefault(tool_use.id, time.perf_counter())
+        )
+        self._tasks[tool_use.id] = task
+
+    def response_finished(self) -> None:
+        """Mark the end of the response, after which no tool call overlaps it."""
+        self._response_finished_at = time.perf_counter()
+
+    @property
+    def overlap(self) -> float:
+        """Seconds of tool execution that ran while the response was generated."""
+        if self._response_finished_at is None:
+            return 0.0
+        return sum(
+            max(
+                min(
+                    self._finished_at.get(tool_use_id, self._response_finished_at),
+                    self._response_finished_at,
+                )
+                - started_at,
+                0.0,
+            )
+            for tool_use_id, started_at in self._started_at.items()
+        )
+
+    async def results(
+        self, tool_use_blocks: list[ToolUseBlock]
+    ) -> list[dict[str, Any]]:
+        """
+        Wait for the calls of tool_use_blocks, sending any not yet sent, and
+        return their tool_result blocks in the same order.
+        """
+        for tool_use in tool_use_blocks:
+            self.start(tool_use)
+        tool_outputs = await asyncio.gather(
+            *(self._tasks[tool_use.id] for tool_use in tool_use_blocks)
+        )
+        return [
+            {
+                "type": "tool_result",
+                "tool_use_id": tool_use.id,
+                "content": "\n".join(tool_output),
+            }
+            for tool_use, tool_output in zip(
+                tool_use_blocks, tool_outputs, strict=True
+            )
+        ]
+
+    def cancel(self) -> None:
+        """Cancel the calls still running, whose results will not be used."""
+        for task in self._tasks.values():
+            task.cancel()
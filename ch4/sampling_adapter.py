@@ -0,0 +1,108 @@
+"""
+Conversions between MCP sampling types and the Anthropic Messages API, shared by
+the clients of this chapter.
+
+Payloads are handed across by reference: base64 image data goes straight from
+the MCP content into the Anthropic request without being decoded and re-encoded,
+and content models are built with model_construct so large strings are not
+validated a second time.
+"""
+
+import json
+from typing import Any
+
+from anthropic.types import Message
+from mcp.types import (
+    CreateMessageRequestParams,
+    CreateMessageResult,
+    SamplingMessage,
+    TextContent,
+)
+
+STOP_REASONS = {
+    "end_turn": "endTurn",
+    "max_tokens": "maxTokens",
+    "stop_sequence": "stopSequence",
+    "tool_use": "toolUse",
+}
+
+
+def to_anthropic_message(message: SamplingMessage) -> dict[str, Any]:
+    """Convert one MCP sampling message to an Anthropic message param."""
+    match message.content.type:
+        case "text":
+            content = message.content.text
+        case "image":
+            content = [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": message.content.mimeType,
+                        "data": message.content.data,
+                    },
+                }
+            ]
+        case _:
+            # The Messages API has no audio input, so describe it instead
+            content = (
+                f"[{message.content.type} content ({message.content.mimeType})]"
+            )
+    return {"role": message.role, "content": content}
+
+
+def to_anthropic_request(
+    params: CreateMessageRequestParams, model: str
+) -> dict[str, Any]:
+    """Build keyword arguments for messages.create/stream from a sampling request."""
+    request_kwargs = {
+        "max_tokens": params.maxTokens,
+        "messages": [to_anthropic_message(message) for message in params.messages],
+        "model": model,
+    }
+    if params.systemPrompt:
+        request_kwargs["system"] = params.systemPrompt
+    if params.temperature is not None:
+        request_kwargs["temperature"] = params.temperature
+    if params.stopSequences:
+        request_kwargs["stop_sequences"] = params.stopSequences
+    return request_kwargs
+
+
+def to_mcp_content(response: Message) -> TextContent:
+    """
+    Convert the content blocks of an Anthropic response to a single MCP content
+    item, as CreateMessageResult only carries one.
+    """
+    text_parts = []
+    for block in response.content:
+        match block.type:
+            case "text":
+                text_parts.append(block.text)
+            case "tool_use":
+                # Sampling results have no tool-use content type, so the call is
+                # passed back as JSON for the server to interpret
+                text_parts.append(
+                    json.dumps(
+                        {
+                            "type": "tool_use",
+                            "id": block.id,
+                            "name": block.name,
+                            "input": block.input,
+                        }
+                    )
+                )
+
+    # A single block is passed through as-is rather than joined into a copy
+    text = text_parts[0] if len(text_parts) == 1 else "\n".join(text_parts)
+    return TextContent.model_construct(type="text", text=text)
+
+
+def to_create_message_result(response: Message) -> CreateMessageResult:
+    """Convert an Anthropic response to the result of a sampling request."""
+    return CreateMessageResult(
+        role=response.role,
+        content=to_mcp_content(response),
+        model=response.model,
+        stopReason=STOP_REASONS.get(response.stop_reason, response.stop_reason),
+    )
@@ -36,9 +36,7 @@ async def list_resources(request: ListResourcesRequest) -> ListResourcesResult:
     start_index = 0
     if cursor is not None:
         start_index = int(cursor)
-        end_index = min(start_index + PAGE_SIZE, TOTAL_RESOURCES)
-    else:
-        end_index = TOTAL_RESOURCES
+    end_index = min(start_index + PAGE_SIZE, TOTAL_RESOURCES)
 
     resources = RESOURCES[start_index:end_index]
 
@@ -0,0 +1,215 @@
+"""
+Cancellable server-initiated requests.
+
+ServerSession.send_request assigns the JSON-RPC request ID internally and never
+hands it back, so a tool that wants to cancel its own request has to guess the ID.
+CancellableSession wraps a session, reads the real ID off the request as it is
+written to the transport, applies a deadline, and sends notifications/cancelled
+when it expires.
+"""
+
+import asyncio
+from contextvars import ContextVar
+from typing import Any
+
+from mcp.server.session import ServerSession
+from mcp.shared.message import ServerMessageMetadata, SessionMessage
+from mcp.shared.session import RequestId
+from mcp.types import (
+    CancelledNotification,
+    CancelledNotificationParams,
+    CreateMessageRequest,
+    CreateMessageRequestParams,
+    CreateMessageResult,
+    JSONRPCRequest,
+    ModelPreferences,
+    SamplingMessage,
+    ServerNotification,
+    ServerRequest,
+)
+from pydantic import BaseModel
+
+# Set in the task sending a request, to receive the ID the request goes out with
+_sent_request_id: ContextVar[asyncio.Future[RequestId] | None] = ContextVar(
+    "_sent_request_id", default=None
+)
+
+
+class RequestDeadlineExceeded(Exception):
+    """Raised when a request was cancelled because its deadline expired."""
+
+    def __init__(self, request_id: RequestId, timeout: float) -> None:
+        super().__init__(f"Request {request_id} cancelled after {timeout} seconds")
+        self.request_id = request_id
+        self.timeout = timeout
+
+
+class PendingRequest[ResultT: BaseModel]:
+    """
+    A request that has been sent to the client and is waiting for its response.
+    The request ID is the one actually used on the wire.
+    """
+
+    def __init__(
+        self,
+        session: ServerSession,
+        request_id: RequestId,
+        task: asyncio.Task[ResultT],
+        timeout: float,
+        related_request_id: RequestId | None = None,
+    ) -> None:
+        self.request_id = request_id
+        self.timeout = timeout
+        self.deadline = asyncio.get_running_loop().time() + timeout
+        self._session = session
+        self._task = task
+        self._related_request_id = related_request_id
+        self._cancelled = False
+
+    async def result(self) -> ResultT:
+        """
+        Wait for the response. If the deadline passes first, the request is
+        cancelled on the client and RequestDeadlineExceeded is raised.
+        """
+        try:
+            async with asyncio.timeout_at(self.deadline):
+                return await asyncio.shield(self._task)
+        except TimeoutError:
+            await self.cancel(
+                reason=f"Server timeout: request took longer than {self.timeout}s"
+            )
+            raise RequestDeadlineExceeded(self.request_id, self.timeout) from None
+
+    async def cancel(self, reason: str | None = None) -> None:
+        """
+        Stop waiting for the response and tell the client to abandon the request.
+        """
+        if self._cancelled or self._task.done():
+            return
+        self._cancelled = True
+        self._task.cancel()
+        await self._session.send_notification(
+            ServerNotification(
+                CancelledNotification(
+                    params=CancelledNotificationParams(
+                        requestId=self.request_id, reason=reason
+                    )
+                )
+            ),
+            related_request_id=self._related_request_id,
+        )
+
+
+class _RequestIdRecorder:
+    """
+    Write stream of a session that hands the ID of each outgoing request to the
+    task sending it. BaseSession.send_request writes the request from the task
+    that called it, so the ID always reaches the right sender.
+    """
+
+    def __init__(self, stream: Any) -> None:
+        self._stream = stream
+
+    async def send(self, message: SessionMessage) -> None:
+        request_id = _sent_request_id.get()
+        root = message.message.root
+        if (
+            request_id is not None
+            and not request_id.done()
+            and isinstance(root, JSONRPCRequest)
+        ):
+            request_id.set_result(root.id)
+        await self._stream.send(message)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+class CancellableSession:
+    """
+    Wraps a ServerSession to send requests that carry their real request ID and
+    are cancelled automatically when their deadline expires.
+    """
+
+    def __init__(
+        self, session: ServerSession, related_request_id: RequestId | None = None
+    ) -> None:
+        self._session = session
+        self._related_request_id = related_request_id
+        # The session keeps its write stream to itself, so this is the one place
+        # the wrapper reaches inside it
+        if not isinstance(session._write_stream, _RequestIdRecorder):
+            session._write_stream = _RequestIdRecorder(session._write_stream)
+
+    async def send_request[ResultT: BaseModel](
+        self,
+        request: ServerRequest,
+        result_type: type[ResultT],
+        timeout: float,
+    ) -> PendingRequest[ResultT]:
+        """
+        Send a request and return as soon as it is on the wire, without waiting
+        for the response.
+        """
+        loop = asyncio.get_running_loop()
+        request_id_future: asyncio.Future[RequestId] = loop.create_future()
+
+        async def send() -> ResultT:
+            _sent_request_id.set(request_id_future)
+            try:
+                return await self._session.send_request(
+                    request=request,
+                    result_type=result_type,
+                    metadata=ServerMessageMetadata(
+                        related_request_id=self._related_request_id
+                    ),
+                )
+            except asyncio.CancelledError:
+                # Stopped before the request was written, so it has no ID
+                request_id_future.cancel()
+                raise
+            except Exception as e:
+                if not request_id_future.done():
+                    request_id_future.set_exception(e)
+                raise
+
+        task = asyncio.create_task(send())
+        request_id = await request_id_future
+        return PendingRequest(
+            session=self._session,
+            request_id=request_id,
+            task=task,
+            timeout=timeout,
+            related_request_id=self._related_request_id,
+        )
+
+    async def create_message(
+        self,
+        messages: list[SamplingMessage],
+        *,
+        max_tokens: int,
+        timeout: float,
+        system_prompt: str | None = None,
+        temperature: float | None = None,
+        stop_sequences: list[str] | None = None,
+        metadata: dict[str, Any] | None = None,
+        model_preferences: ModelPreferences | None = None,
+    ) -> PendingRequest[CreateMessageResult]:
+        """Send a sampling/createMessage request with a deadline."""
+        return await self.send_request(
+            request=ServerRequest(
+                CreateMessageRequest(
+                    params=CreateMessageRequestParams(
+                        messages=messages,
+                        systemPrompt=system_prompt,
+                        temperature=temperature,
+                        maxTokens=max_tokens,
+                        stopSequences=stop_sequences,
+                        metadata=metadata,
+                        modelPreferences=model_preferences,
+                    ),
+                )
+            ),
+            result_type=CreateMessageResult,
+            timeout=timeout,
+        )
@@ -1,14 +1,12 @@
-import asyncio
 import logging
 
+from cancellable_request import CancellableSession, RequestDeadlineExceeded
 from mcp.server.fastmcp import Context, FastMCP
 from mcp.server.session import ServerSession
 from mcp.types import (
     CancelledNotification,
-    CancelledNotificationParams,
     ModelPreferences,
     SamplingMessage,
-    ServerNotification,
     TextContent,
 )
 
@@ -36,53 +34,48 @@ async def sampling_with_timeout(ctx: Context[ServerSession, None]) -> str:
     if not ctx.session.client_params.capabilities.sampling:
         return "Error: Sampling is not supported by this client"
 
-    # Capture the request ID that will be used by the next send_request call
-    request_id = ctx.session._request_id
-    await ctx.info(f"Starting sampling request with ID: {request_id}")
-
+    cancellable_session = CancellableSession(
+        ctx.session, related_request_id=ctx.request_context.request_id
+    )
     try:
-        # Use asyncio.timeout to limit how long we wait for the response
-        async with asyncio.timeout(5.0):  # 5 second timeout
-            result = await ctx.session.create_message(
-                messages=[
-                    SamplingMessage(
-                        role="user",
-                        content=TextContent(
-                            type="text",
-                            text=(
-                                "Write a very long, detailed essay about "
-                                "the history of mathematics."
-                            ),
+        # The request ID comes back from the send itself, so concurrent tools can't
+        # cause it to be attributed to the wrong request
+        pending = await cancellable_session.create_message(
+            messages=[
+                SamplingMessage(
+                    role="user",
+                    content=TextContent(
+                        type="text",
+                        text=(
+                            "Write a very long, detailed essay about "
+                            "the history of mathematics."
                         ),
-                    )
-                ],
-                max_tokens=10000,
-                model_preferences=ModelPreferences(
-                    intelligencePriority=1.0,
-                ),
-            )
-            await ctx.info("Sampling completed successfully")
-            if result.content:
-                return f"Result: {result.content.text[:200]}..."
-            else:
-                return "No content in result"
-
-    except TimeoutError:
-        await ctx.warning(f"Sampling request {request_id} timed out after 5 seconds")
-
-        await ctx.session.send_notification(
-            ServerNotification(
-                CancelledNotification(
-                    params=CancelledNotificationParams(
-                        requestId=request_id,
-                        reason="Server timeout: Sampling request took too long (>5s)",
-                    )
+                    ),
                 )
-            )
+            ],
+            max_tokens=10000,
+            model_preferences=ModelPreferences(
+                intelligencePriority=1.0,
+            ),
+            timeout=5.0,  # 5 second deadline
         )
+        await ctx.info(f"Started sampling request with ID: {pending.request_id}")
+        result = await pending.result()
+        await ctx.info("Sampling completed successfully")
+        if result.content:
+            return f"Result: {result.content.text[:200]}..."
+        else:
+            return "No content in result"
 
-        await ctx.info(f"Sent cancellation notification for request {request_id}")
-        return f"Request timed out and cancellation sent to client (request ID: {request_id})"
+    except RequestDeadlineExceeded as e:
+        await ctx.warning(
+            f"Sampling request {e.request_id} timed out after {e.timeout} seconds"
+        )
+        await ctx.info(f"Sent cancellation notification for request {e.request_id}")
+        return (
+            "Request timed out and cancellation sent to client "
+            f"(request ID: {e.request_id})"
+        )
 
     except Exception as e:
         await ctx.error(f"Sampling request failed: {e}")